@@ -0,0 +1,31 @@
+"""
+Сравнение `update_objs` в цикле и `bulk_update_objs`.
+
+Запуск: `python -m benchmarks.bench_bulk_update --rows 10000`
+"""
+
+import asyncio
+
+from benchmarks.common import Timer, User, make_assistant, make_parser, make_rows
+
+
+async def main(url: str, rows: int) -> None:
+    """Запуск замеров."""
+
+    sas, engine = await make_assistant(url)
+    await sas.create_objs(User, make_rows(rows))
+
+    with Timer('update_objs (цикл)', rows):
+        for idx in range(1, rows + 1):
+            await sas.update_objs(User, {'name': f'loop{idx}'}, [User.id == idx])
+
+    data = [{'id': idx, 'name': f'bulk{idx}'} for idx in range(1, rows + 1)]
+    with Timer('bulk_update_objs', rows):
+        await sas.bulk_update_objs(User, data)
+
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    args = make_parser(__doc__).parse_args()
+    asyncio.run(main(args.url, args.rows))
@@ -0,0 +1,57 @@
+"""
+Сравнение `create_obj` в цикле, `create_objs` и `load_objs`.
+
+На PostgreSQL через asyncpg `load_objs` использует `COPY`, на SQLite - пачки
+`create_objs`/`upsert_objs`.
+
+Запуск: `python -m benchmarks.bench_load --rows 10000`
+"""
+
+import asyncio
+import csv
+import tempfile
+from pathlib import Path
+
+from benchmarks.common import Timer, User, make_assistant, make_parser, make_rows
+
+
+async def main(url: str, rows: int) -> None:
+    """Запуск замеров."""
+
+    sas, engine = await make_assistant(url)
+
+    data = make_rows(rows, prefix='obj')
+    with Timer('create_obj (цикл)', rows):
+        for row in data:
+            await sas.create_obj(User, row)
+
+    data = make_rows(rows, start=rows + 1, prefix='batch')
+    with Timer('create_objs', rows):
+        await sas.create_objs(User, data)
+
+    data = make_rows(rows, start=2 * rows + 1, prefix='load')
+    with Timer('load_objs (список)', rows):
+        await sas.load_objs(User, data)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / 'users.csv'
+        data = make_rows(rows, start=3 * rows + 1, prefix='csv')
+        with path.open('w', encoding='utf-8', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=list(data[0]))
+            writer.writeheader()
+            writer.writerows(data)
+
+        with Timer('load_objs (CSV)', rows):
+            await sas.load_objs(User, path)
+
+    # Строки, загруженные выше, обновляются по первичному ключу
+    data = make_rows(rows, start=2 * rows + 1, prefix='merge')
+    with Timer('load_objs (conflict_keys)', rows):
+        await sas.load_objs(User, data, conflict_keys=['id'])
+
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    args = make_parser(__doc__).parse_args()
+    asyncio.run(main(args.url, args.rows))
@@ -0,0 +1,40 @@
+"""
+Накладные расходы логирования `get_all_objs` и `create_or_update`.
+
+Запуск: `python -m benchmarks.bench_logging --rows 10000`
+"""
+
+import asyncio
+
+from loguru import logger
+
+from benchmarks.common import Timer, User, make_assistant, make_parser, make_rows
+
+CALLS = 50
+
+
+async def main(url: str, rows: int) -> None:
+    """Запуск замеров."""
+
+    sas, engine = await make_assistant(url)
+    await sas.create_objs(User, make_rows(rows))
+    data = {'name': 'x' * 1000}
+
+    for level in ('INFO', 'DEBUG'):
+        logger.remove()
+        logger.add(lambda _: None, level=level)
+
+        with Timer(f'get_all_objs, уровень {level}', CALLS):
+            for _ in range(CALLS):
+                await sas.get_all_objs(User)
+
+        with Timer(f'create_or_update, уровень {level}', CALLS):
+            for _ in range(CALLS):
+                await sas.create_or_update(User, data, [User.id == 1])
+
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    args = make_parser(__doc__).parse_args()
+    asyncio.run(main(args.url, args.rows))
@@ -0,0 +1,53 @@
+"""
+Время получения первой и глубокой страницы через `OFFSET` и `paginate`.
+
+Запуск: `python -m benchmarks.bench_paginate --rows 100000`
+"""
+
+import asyncio
+
+from benchmarks.common import Timer, User, make_assistant, make_parser, make_rows
+from sql_assistant.handler import encode_cursor
+
+PAGE_SIZE = 50
+REPEATS = 20
+
+
+async def offset_page(sas, page: int) -> list:
+    """Получение страницы через `OFFSET`."""
+
+    async with sas.async_session() as session:
+        query = (
+            User.__table__.select()
+            .order_by(User.id)
+            .offset(page * PAGE_SIZE)
+            .limit(PAGE_SIZE)
+        )
+        return (await session.execute(query)).all()
+
+
+async def main(url: str, rows: int) -> None:
+    """Запуск замеров."""
+
+    sas, engine = await make_assistant(url)
+    await sas.create_objs(User, make_rows(rows))
+
+    deep_page = rows // PAGE_SIZE - 1
+    # Токен после последней строки предыдущей страницы
+    token = encode_cursor([deep_page * PAGE_SIZE])
+
+    for name, page, after in (('первая', 0, None), ('глубокая', deep_page, token)):
+        with Timer(f'OFFSET, {name} страница', REPEATS):
+            for _ in range(REPEATS):
+                await offset_page(sas, page)
+
+        with Timer(f'paginate, {name} страница', REPEATS):
+            for _ in range(REPEATS):
+                await sas.paginate(User, [], [User.id], PAGE_SIZE, after=after)
+
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    args = make_parser(__doc__, rows=100_000).parse_args()
+    asyncio.run(main(args.url, args.rows))
@@ -0,0 +1,66 @@
+"""
+Накладные расходы построения запроса `get_all_objs` с кэшем форм и без него.
+
+Запуск: `python -m benchmarks.bench_query_cache --rows 10`
+"""
+
+import asyncio
+
+from sqlalchemy import func
+
+from benchmarks.common import (
+    Post,
+    Timer,
+    User,
+    make_assistant,
+    make_parser,
+    make_posts,
+    make_rows,
+)
+
+CALLS = 5_000
+
+
+def query_params(idx: int) -> dict:
+    """Параметры запроса одной формы с разными значениями."""
+
+    return {
+        'where': [User.id > idx % 10, User.is_delete == False],
+        'order_by': [User.name.desc()],
+        'group_by': [User.name],
+        'join_lst': [{'target': Post, 'onclause': Post.user_id == User.id}],
+        'aggregate': {'id': func.count},
+        'fields': [User.name],
+    }
+
+
+async def main(url: str, rows: int) -> None:
+    """Запуск замеров."""
+
+    for cache_size in (0, 128):
+        sas, engine = await make_assistant(url, query_cache_size=cache_size)
+        await sas.create_objs(User, make_rows(rows))
+        await sas.create_objs(Post, make_posts(rows))
+
+        # Параметры строятся заранее, чтобы замерять только работу помощника
+        params = [query_params(idx) for idx in range(CALLS)]
+
+        name = 'с кэшем' if cache_size else 'без кэша'
+        shape = 'posts_by_name' if cache_size else None
+        with Timer(f'построение запроса, {name}', CALLS):
+            for kwargs in params:
+                sas._build_select(User, **kwargs, shape=shape)  # noqa: SLF001
+
+        with Timer(f'get_all_objs, {name}', CALLS):
+            for kwargs in params:
+                await sas.get_all_objs(User, **kwargs, shape=shape)
+
+        if sas.query_cache is not None:
+            print(sas.query_cache.info())  # noqa: T201
+
+        await engine.dispose()
+
+
+if __name__ == '__main__':
+    args = make_parser(__doc__, rows=10).parse_args()
+    asyncio.run(main(args.url, args.rows))
@@ -0,0 +1,31 @@
+"""
+Сравнение получения экземпляров ORM и строк `readonly` в `get_all_objs`.
+
+Запуск: `python -m benchmarks.bench_readonly --rows 100000`
+"""
+
+import asyncio
+
+from benchmarks.common import Timer, User, make_assistant, make_parser, make_rows
+
+REPEATS = 5
+
+
+async def main(url: str, rows: int) -> None:
+    """Запуск замеров."""
+
+    sas, engine = await make_assistant(url)
+    await sas.create_objs(User, make_rows(rows))
+
+    for readonly in (False, True):
+        name = 'строки readonly' if readonly else 'экземпляры ORM'
+        with Timer(f'get_all_objs, {name}', rows * REPEATS):
+            for _ in range(REPEATS):
+                await sas.get_all_objs(User, readonly=readonly)
+
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    args = make_parser(__doc__, rows=100_000).parse_args()
+    asyncio.run(main(args.url, args.rows))
@@ -0,0 +1,78 @@
+"""
+Сравнение `get_all_objs` (с кэшем форм и без него) и `execute_spec`.
+
+Запуск: `python -m benchmarks.bench_spec --rows 10`
+"""
+
+import asyncio
+
+from sqlalchemy import bindparam, func
+
+from benchmarks.common import (
+    Post,
+    Timer,
+    User,
+    make_assistant,
+    make_parser,
+    make_posts,
+    make_rows,
+)
+from sql_assistant.spec import QuerySpec
+
+CALLS = 5_000
+
+# Та же форма запроса, что и в `bench_query_cache`, построенная один раз
+SPEC = QuerySpec(
+    User,
+    where=[User.id > bindparam('min_id'), User.is_delete == False],
+    order_by=[User.name.desc()],
+    group_by=[User.name],
+    join_lst=[{'target': Post, 'onclause': Post.user_id == User.id}],
+    aggregate={'id': func.count},
+    fields=[User.name],
+)
+
+
+def query_params(idx: int) -> dict:
+    """Параметры `get_all_objs` для той же формы запроса."""
+
+    return {
+        'where': [User.id > idx % 10, User.is_delete == False],
+        'order_by': [User.name.desc()],
+        'group_by': [User.name],
+        'join_lst': [{'target': Post, 'onclause': Post.user_id == User.id}],
+        'aggregate': {'id': func.count},
+        'fields': [User.name],
+    }
+
+
+async def main(url: str, rows: int) -> None:
+    """Запуск замеров."""
+
+    for cache_size in (0, 128):
+        sas, engine = await make_assistant(url, query_cache_size=cache_size)
+        await sas.create_objs(User, make_rows(rows))
+        await sas.create_objs(Post, make_posts(rows))
+
+        name = 'с кэшем' if cache_size else 'без кэша'
+        shape = 'posts_by_name' if cache_size else None
+        with Timer(f'get_all_objs, {name}', CALLS):
+            for idx in range(CALLS):
+                await sas.get_all_objs(User, **query_params(idx), shape=shape)
+
+        await engine.dispose()
+
+    sas, engine = await make_assistant(url)
+    await sas.create_objs(User, make_rows(rows))
+    await sas.create_objs(Post, make_posts(rows))
+
+    with Timer('execute_spec', CALLS):
+        for idx in range(CALLS):
+            await sas.execute_spec(SPEC, {'min_id': idx % 10})
+
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    args = make_parser(__doc__, rows=10).parse_args()
+    asyncio.run(main(args.url, args.rows))
@@ -0,0 +1,79 @@
+"""
+Время импорта `sql_assistant.main` и создания экземпляров `SqlAssistant`.
+
+Запуск: `python -m benchmarks.bench_startup --instances 10000`
+"""
+
+import subprocess
+import sys
+from pathlib import Path
+
+from loguru import logger
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from benchmarks.common import Base, Timer, make_parser
+from sql_assistant.main import SqlAssistant
+
+IMPORTS = 5
+
+
+def import_time() -> float:
+    """Время импорта модуля помощника в новом процессе в миллисекундах."""
+
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import sql_assistant.main'],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    # Строка вида `import time: собственное | накопленное | модуль`
+    line = result.stderr.strip().splitlines()[-1]
+
+    return int(line.split('|')[1]) / 1000
+
+
+def open_files() -> int | None:
+    """Количество открытых процессом файловых дескрипторов (только Linux)."""
+
+    fd_path = Path('/proc/self/fd')
+
+    return len(list(fd_path.iterdir())) if fd_path.exists() else None
+
+
+def main(url: str, instances: int) -> None:
+    """Запуск замеров."""
+
+    best = min(import_time() for _ in range(IMPORTS))
+    print(f'{"импорт sql_assistant.main":40} {best:9.1f} мс')  # noqa: T201
+
+    engine = create_async_engine(url)
+    async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    logger.remove()  # Логи не должны влиять на замеры
+
+    with Timer('создание, переданный logger', instances):
+        for _ in range(instances):
+            SqlAssistant(base=Base, async_session=async_session, log=logger)
+
+    files = open_files()
+    with Timer('создание, logger по умолчанию', instances):
+        for _ in range(instances):
+            SqlAssistant(base=Base, async_session=async_session)
+
+    if files is not None:
+        # Файл логов по умолчанию должен открываться один раз на процесс
+        opened = open_files() - files
+        print(f'{"открыто файлов":40} {opened:9}')  # noqa: T201
+
+    logger.remove()
+
+
+if __name__ == '__main__':
+    parser = make_parser(__doc__)
+    parser.add_argument(
+        '--instances', type=int, default=10_000, help='количество экземпляров'
+    )
+    args = parser.parse_args()
+
+    main(args.url, args.instances)
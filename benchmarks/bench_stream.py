@@ -0,0 +1,53 @@
+"""
+Пиковое потребление памяти `get_all_objs` и `iter_objs`.
+
+Запуск: `python -m benchmarks.bench_stream --rows 20000`
+"""
+
+import asyncio
+import tracemalloc
+
+from benchmarks.common import User, make_assistant, make_parser, make_rows
+
+
+async def peak_memory(coro) -> float:
+    """Возвращает пиковое потребление памяти корутиной в МБ."""
+
+    tracemalloc.start()
+    await coro
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return peak / 1024 / 1024
+
+
+async def consume(sas) -> None:
+    """Читает всю таблицу потоково."""
+
+    async for _ in sas.iter_objs(User, chunk_size=1000):
+        pass
+
+
+async def main(url: str, rows: int) -> None:
+    """Запуск замеров."""
+
+    sas, engine = await make_assistant(url)
+
+    inserted = 0
+    for size in (rows, rows * 4):
+        await sas.create_objs(User, make_rows(size - inserted, start=inserted + 1))
+        inserted = size
+
+        all_peak = await peak_memory(sas.get_all_objs(User))
+        iter_peak = await peak_memory(consume(sas))
+        print(  # noqa: T201
+            f'{size:>9} строк: get_all_objs {all_peak:8.1f} МБ, '
+            f'iter_objs {iter_peak:8.1f} МБ'
+        )
+
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    args = make_parser(__doc__).parse_args()
+    asyncio.run(main(args.url, args.rows))
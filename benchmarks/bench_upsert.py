@@ -0,0 +1,33 @@
+"""
+Сравнение `create_or_update` в цикле и `upsert_objs`.
+
+Запуск: `python -m benchmarks.bench_upsert --rows 10000`
+"""
+
+import asyncio
+
+from benchmarks.common import Timer, User, make_assistant, make_parser, make_rows
+
+
+async def main(url: str, rows: int) -> None:
+    """Запуск замеров."""
+
+    sas, engine = await make_assistant(url)
+
+    # Половина строк уже есть в БД, половина - новые
+    await sas.create_objs(User, make_rows(rows // 2))
+    data = make_rows(rows, prefix='new')
+
+    with Timer('create_or_update (цикл)', rows):
+        for row in data:
+            await sas.create_or_update(User, row, [User.id == row['id']])
+
+    with Timer('upsert_objs', rows):
+        await sas.upsert_objs(User, make_rows(rows, prefix='upsert'), ['id'])
+
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    args = make_parser(__doc__).parse_args()
+    asyncio.run(main(args.url, args.rows))
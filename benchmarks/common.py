@@ -0,0 +1,199 @@
+"""
+Общие объекты для бенчмарков.
+
+Бенчмарки запускаются на локальной SQLite через `aiosqlite` (нужно установить
+отдельно), либо на любой другой БД, переданной через `--url`.
+"""
+
+import argparse
+import resource
+import time
+from pathlib import Path
+
+from loguru import logger
+from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Integer, String, func
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import declarative_base, sessionmaker
+
+from sql_assistant.main import SqlAssistant
+
+DB_PATH = Path('bench.db')
+DATABASE_URL = f'sqlite+aiosqlite:///{DB_PATH}'
+
+Base = declarative_base()
+
+
+class User(Base):
+    """Таблица пользователей."""
+
+    # Название таблицы
+    __tablename__ = 'user'
+
+    id = Column(Integer(), autoincrement=True, primary_key=True)
+    username = Column(String(100), nullable=False, unique=True)
+    name = Column(String(100))
+    password = Column(String(100), nullable=False)
+    create_at = Column(DateTime(), nullable=False, default=func.now())
+    is_delete = Column(Boolean(), nullable=False, default=False)
+
+
+class Post(Base):
+    """Таблица публикаций пользователей."""
+
+    # Название таблицы
+    __tablename__ = 'post'
+
+    id = Column(Integer(), autoincrement=True, primary_key=True)
+    user_id = Column(Integer(), ForeignKey('user.id'), nullable=False, index=True)
+    title = Column(String(100), nullable=False)
+
+
+def make_parser(description: str, rows: int = 10_000) -> argparse.ArgumentParser:
+    """Возвращает парсер стандартных аргументов бенчмарка."""
+
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--url', default=DATABASE_URL, help='строка подключения')
+    parser.add_argument('--rows', type=int, default=rows, help='количество строк')
+
+    return parser
+
+
+def make_rows(count: int, start: int = 1, prefix: str = 'user') -> list[dict]:
+    """Генерация данных пользователей."""
+
+    return [
+        {
+            'id': idx,
+            'username': f'{prefix}{idx}@q.q',
+            'name': f'{prefix}{idx}',
+            'password': f'pass{idx}',
+        }
+        for idx in range(start, start + count)
+    ]
+
+
+def make_posts(users: int, per_user: int = 2) -> list[dict]:
+    """Генерация данных публикаций пользователей."""
+
+    return [
+        {'user_id': user_id, 'title': f'post{user_id}_{idx}'}
+        for user_id in range(1, users + 1)
+        for idx in range(per_user)
+    ]
+
+
+async def make_assistant(url: str = DATABASE_URL, **kwargs):
+    """
+    Создаёт чистую БД и помощника для неё.
+
+    :param url: строка подключения к БД
+    :param kwargs: дополнительные параметры `SqlAssistant`
+
+    :raise Exception: название БД не похоже на тестовое
+
+    :return: помощник и движок БД
+    """
+
+    # Таблицы пересоздаются, поэтому случайно переданная рабочая БД недопустима
+    database = make_url(url).database or ''
+    if not database.endswith('_test') and 'bench' not in database:
+        msg = (
+            f'Бенчмарк пересоздаёт таблицы, название БД `{database}` должно '
+            f'оканчиваться на `_test` или содержать `bench`!'
+        )
+        raise Exception(msg)
+
+    if url == DATABASE_URL:
+        DB_PATH.unlink(missing_ok=True)
+
+    engine = create_async_engine(url)
+    async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+    logger.remove()  # Логи не должны влиять на замеры
+
+    sas = SqlAssistant(base=Base, async_session=async_session, log=logger, **kwargs)
+
+    return sas, engine
+
+
+class Timer:
+    """Замер времени выполнения блока кода."""
+
+    def __init__(self, name: str, ops: int = 1) -> None:
+        """
+        Инициализация замера.
+
+        :param name: название замера
+        :param ops: количество операций внутри блока
+        """
+
+        self.name = name
+        self.ops = ops
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, *args) -> None:
+        if exc_type is not None:
+            return
+
+        self.elapsed = time.perf_counter() - self.start
+        print(  # noqa: T201
+            f'{self.name:40} {self.elapsed:9.3f} s '
+            f'{self.ops / self.elapsed:12.0f} ops/s'
+        )
+
+
+def percentile(values: list[float], share: float) -> float:
+    """Перцентиль отсортированного списка значений."""
+
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+def peak_rss() -> float:
+    """Пиковое потребление памяти процессом в МБ."""
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def measure(name: str, make_call, ops: int) -> dict:
+    """
+    Замер отдельных вызовов корутины.
+
+    :param name: название замера
+    :param make_call: функция `(номер вызова) -> корутина`
+    :param ops: количество вызовов
+
+    :return: ops/s, p50 и p99 в миллисекундах и пиковое потребление памяти
+    """
+
+    latencies = []
+    start = time.perf_counter()
+    for idx in range(ops):
+        call_start = time.perf_counter()
+        await make_call(idx)
+        latencies.append(time.perf_counter() - call_start)
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    result = {
+        'name': name,
+        'ops_per_sec': ops / elapsed,
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'peak_rss_mb': peak_rss(),
+    }
+    print(  # noqa: T201
+        f'{name:40} {result["ops_per_sec"]:10.0f} ops/s '
+        f'p50 {result["p50_ms"]:8.3f} мс p99 {result["p99_ms"]:8.3f} мс '
+        f'RSS {result["peak_rss_mb"]:8.1f} МБ'
+    )
+
+    return result
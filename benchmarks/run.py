@@ -0,0 +1,120 @@
+"""
+Набор бенчмарков основных методов `SqlAssistant`.
+
+Для каждого размера таблицы создаётся чистая БД, после чего замеряются
+`get_obj`, `get_all_objs` с джойном и агрегатами, `create_obj`, `update_objs` и
+`create_or_update`. Выводятся ops/s, p50/p99 задержки и пиковое потребление
+памяти процессом.
+
+Запуск: `python -m benchmarks.run --sizes 1000 100000 1000000 --json result.json`
+"""
+
+import asyncio
+import json
+from pathlib import Path
+
+from sqlalchemy import func
+
+from benchmarks.common import (
+    Post,
+    User,
+    make_assistant,
+    make_parser,
+    make_posts,
+    make_rows,
+    measure,
+)
+
+# Размер пачки при заполнении таблиц
+FILL_BATCH = 50_000
+# Количество строк, возвращаемых `get_all_objs`
+SELECT_ROWS = 100
+
+
+async def fill(sas, size: int) -> None:
+    """Заполнение таблиц пользователями и их публикациями."""
+
+    for start in range(1, size + 1, FILL_BATCH):
+        count = min(FILL_BATCH, size - start + 1)
+        await sas.create_objs(User, make_rows(count, start=start))
+        await sas.create_objs(
+            Post,
+            [
+                {'user_id': post['user_id'] + start - 1, 'title': post['title']}
+                for post in make_posts(count)
+            ],
+        )
+
+
+async def run_size(url: str, size: int, ops: int) -> list[dict]:
+    """Замеры на таблице из `size` строк."""
+
+    sas, engine = await make_assistant(url)
+    await fill(sas, size)
+
+    print(f'== {size} строк ==')  # noqa: T201
+
+    def user_id(idx: int) -> int:
+        return idx * 7919 % size + 1
+
+    def get_all_objs(idx: int):
+        start = user_id(idx) % max(1, size - SELECT_ROWS) + 1
+        return sas.get_all_objs(
+            User,
+            where=[User.id.between(start, start + SELECT_ROWS - 1)],
+            group_by=[User.id],
+            join_lst=[{'target': Post, 'onclause': Post.user_id == User.id}],
+            aggregate={'name': func.max},
+            fields=[User.id, func.count(Post.id)],
+        )
+
+    results = [
+        await measure('get_obj', lambda idx: sas.get_obj(User, user_id(idx)), ops),
+        await measure('get_all_objs (join + aggregate)', get_all_objs, ops),
+        await measure(
+            'create_obj',
+            lambda idx: sas.create_obj(User, make_rows(1, size + idx + 1)[0]),
+            ops,
+        ),
+        await measure(
+            'update_objs',
+            lambda idx: sas.update_objs(
+                User, {'name': f'update{idx}'}, [User.id == user_id(idx)]
+            ),
+            ops,
+        ),
+        await measure(
+            'create_or_update',
+            lambda idx: sas.create_or_update(
+                User, {'name': f'cu{idx}'}, [User.id == user_id(idx)]
+            ),
+            ops,
+        ),
+    ]
+
+    await engine.dispose()
+
+    return [{'size': size, **result} for result in results]
+
+
+async def main(url: str, sizes: list[int], ops: int, json_path: str | None) -> None:
+    """Запуск замеров для всех размеров таблиц."""
+
+    results = []
+    for size in sizes:
+        results += await run_size(url, size, ops)
+
+    if json_path:
+        Path(json_path).write_text(json.dumps(results, indent=2), encoding='utf-8')
+
+
+if __name__ == '__main__':
+    parser = make_parser(__doc__)
+    parser.add_argument(
+        '--sizes', type=int, nargs='+', default=[1_000, 100_000, 1_000_000]
+    )
+    parser.add_argument('--ops', type=int, default=500, help='вызовов на замер')
+    parser.add_argument('--json', help='файл для сохранения результатов')
+    args = parser.parse_args()
+
+    asyncio.run(main(args.url, args.sizes, args.ops, args.json))
@@ -0,0 +1,73 @@
+"""Объединение одновременных запросов объектов по ключу."""
+
+import asyncio
+
+
+class BatchLoader:
+    """
+    Объединяет запросы объектов по ключу, сделанные в одном цикле событий.
+
+    Все `load`, вызванные до следующей итерации цикла событий, выполняются одним
+    запросом для каждой таблицы.
+    """
+
+    def __init__(self, load_many) -> None:
+        """
+        Инициализация загрузчика.
+
+        :param load_many: корутина `(db, ids) -> {id: объект}` получения объектов
+        """
+
+        self.__load_many = load_many
+        self.__pending = {}
+        self.__tasks = set()
+        self.__scheduled = False
+
+    async def load(self, db, id_):
+        """
+        Возвращает объект по ключу.
+
+        :param db: класс таблицы, из которой необходимо получить объект
+        :param id_: значение первичного ключа объекта
+
+        :return: объект таблицы или None, если объект не найден
+        """
+
+        loop = asyncio.get_running_loop()
+
+        futures = self.__pending.setdefault(db, {})
+        future = futures.get(id_)
+        if future is None:
+            future = futures[id_] = loop.create_future()
+
+            if not self.__scheduled:
+                self.__scheduled = True
+                loop.call_soon(self.__dispatch)
+
+        # Отмена одного ожидающего не должна отменять запрос для остальных
+        return await asyncio.shield(future)
+
+    def __dispatch(self) -> None:
+        """Запуск накопленных запросов."""
+
+        pending, self.__pending = self.__pending, {}
+        self.__scheduled = False
+
+        for db, futures in pending.items():
+            task = asyncio.create_task(self.__run(db, futures))
+            self.__tasks.add(task)
+            task.add_done_callback(self.__tasks.discard)
+
+    async def __run(self, db, futures: dict) -> None:
+        """Получение объектов одной таблицы и передача их ожидающим."""
+
+        try:
+            objs = await self.__load_many(db, list(futures))
+        except Exception as exp:
+            for future in futures.values():
+                if not future.done():
+                    future.set_exception(exp)
+        else:
+            for id_, future in futures.items():
+                if not future.done():
+                    future.set_result(objs.get(id_))
@@ -0,0 +1,182 @@
+"""Отложенная запись пачками."""
+
+import asyncio
+import contextlib
+import contextvars
+
+
+class WriteBuffer:
+    """
+    Буфер создания и обновления строк, записываемых в БД пачками.
+
+    Строки копятся в памяти и записываются через `create_objs` и
+    `bulk_update_objs`, когда их набирается `max_size` или проходит
+    `flush_interval` секунд. Каждый вызов `create`/`update` возвращает
+    future, который завершается после коммита его пачки или получает её
+    ошибку. Запись выполняется в отдельной сессии, вне `transaction()` и
+    `session_scope()` вызывающего кода.
+    """
+
+    def __init__(
+        self,
+        sas,
+        max_size: int = 1000,
+        flush_interval: float = 1.0,
+        max_pending: int = 10_000,
+    ) -> None:
+        """
+        Инициализация буфера.
+
+        :param sas: помощник работы с БД
+        :param max_size: количество строк, при котором буфер записывается сразу
+        :param flush_interval: максимальное время ожидания записи в секундах
+        :param max_pending: максимальное количество незаписанных строк, при
+            котором `create`/`update` ждут освобождения места
+        """
+
+        self.sas = sas
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self.closed = False
+        # Строки по типу операции, таблице и набору полей
+        self.__groups = {}
+        self.__size = 0
+        self.__slots = asyncio.Semaphore(max_pending)
+        self.__full = asyncio.Event()
+        self.__lock = asyncio.Lock()
+        self.__task = None
+
+    async def create(self, db, data: dict) -> asyncio.Future:
+        """
+        Добавляет строку для создания.
+
+        Строки с одинаковым набором полей создаются одним `create_objs`.
+
+        :param db: класс таблицы, в которую необходимо добавить данные
+        :param data: данные объекта
+
+        :raise Exception: буфер закрыт
+
+        :return: future, завершающийся после записи строки
+        """
+
+        return await self.__add(('create', db, tuple(data)), data)
+
+    async def update(self, db, data: dict) -> asyncio.Future:
+        """
+        Добавляет строку для обновления по первичному ключу.
+
+        :param db: класс таблицы, в которой необходимо обновить данные
+        :param data: данные строки, включая значения первичного ключа
+
+        :raise Exception: буфер закрыт
+
+        :return: future, завершающийся после записи строки
+        """
+
+        return await self.__add(('update', db), data)
+
+    async def flush(self) -> None:
+        """Записывает все накопленные строки."""
+
+        # Запись в пустом контексте, чтобы не использовать сессию вызывающего
+        await asyncio.create_task(self.__flush(), context=contextvars.Context())
+
+    async def close(self) -> None:
+        """Останавливает фоновую запись и записывает оставшиеся строки."""
+
+        self.closed = True
+
+        if self.__task is not None:
+            # Фоновая задача записывает строки и завершается сама, отмена
+            # посреди записи потеряла бы извлечённые из буфера строки
+            self.__full.set()
+            await self.__task
+            self.__task = None
+
+        await self.flush()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.close()
+
+    def __len__(self) -> int:
+        return self.__size
+
+    async def __add(self, key: tuple, data: dict) -> asyncio.Future:
+        """Добавление строки в группу с ожиданием места в буфере."""
+
+        if self.closed:
+            msg = 'Буфер записи закрыт!'
+            raise Exception(msg)
+
+        await self.__slots.acquire()
+
+        # Буфер мог закрыться, пока строка ждала места: после финальной записи
+        # `close()` строка осталась бы незаписанной
+        if self.closed:
+            self.__slots.release()
+            msg = 'Буфер записи закрыт!'
+            raise Exception(msg)
+
+        future = asyncio.get_running_loop().create_future()
+        self.__groups.setdefault(key, []).append((data, future))
+        self.__size += 1
+
+        if self.__task is None:
+            self.__task = asyncio.create_task(
+                self.__run(), context=contextvars.Context()
+            )
+        if self.__size >= self.max_size:
+            self.__full.set()
+
+        return future
+
+    async def __run(self) -> None:
+        """Фоновая запись по заполнению буфера или истечению времени."""
+
+        while not self.closed:
+            with contextlib.suppress(TimeoutError):
+                async with asyncio.timeout(self.flush_interval):
+                    await self.__full.wait()
+
+            await self.__flush()
+
+    async def __flush(self) -> None:
+        """Запись накопленных групп: сначала создание, затем обновление."""
+
+        async with self.__lock:
+            groups, self.__groups = self.__groups, {}
+            self.__size = 0
+            self.__full.clear()
+
+            for key in sorted(groups, key=lambda key: key[0] != 'create'):
+                await self.__write(key, groups[key])
+
+    async def __write(self, key: tuple, items: list) -> None:
+        """Запись одной группы строк и завершение её future."""
+
+        operation, db = key[:2]
+        rows = [data for data, _ in items]
+
+        try:
+            if operation == 'create':
+                await self.sas.create_objs(db, rows)
+            else:
+                await self.sas.bulk_update_objs(db, rows)
+        except Exception as exp:
+            msg = f'Не удалось записать {len(rows)} строк `{db.__name__}` из буфера'
+            self.sas.log.exception(msg)
+
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(exp)
+        else:
+            for _, future in items:
+                if not future.done():
+                    future.set_result(None)
+        finally:
+            for _ in items:
+                self.__slots.release()
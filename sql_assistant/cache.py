@@ -0,0 +1,161 @@
+"""Кэширование запросов и объектов."""
+
+import time
+from collections import OrderedDict
+
+
+class QueryCache:
+    """LRU-кэш построенных запросов выборки по названию их формы."""
+
+    def __init__(self, maxsize: int = 128) -> None:
+        """
+        Инициализация кэша.
+
+        :param maxsize: максимальное количество запросов в кэше
+        """
+
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.__queries = OrderedDict()
+
+    def get(self, key):
+        """
+        Возвращает запрос из кэша.
+
+        :param key: класс таблицы и название формы запроса
+
+        :return: запрос или None, если его нет в кэше
+        """
+
+        query = self.__queries.get(key)
+
+        if query is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.__queries.move_to_end(key)
+
+        return query
+
+    def set(self, key, query) -> None:  # noqa: A003
+        """
+        Сохраняет запрос в кэш, вытесняя самый давно использованный.
+
+        :param key: класс таблицы и название формы запроса
+        :param query: запрос
+        """
+
+        self.__queries[key] = query
+        self.__queries.move_to_end(key)
+
+        if len(self.__queries) > self.maxsize:
+            self.__queries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Очищает кэш и счётчики."""
+
+        self.__queries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def info(self) -> dict:
+        """Статистика использования кэша."""
+
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self.__queries),
+            'maxsize': self.maxsize,
+        }
+
+    def __len__(self) -> int:
+        return len(self.__queries)
+
+
+class CacheBackend:
+    """
+    Интерфейс хранилища кэша объектов.
+
+    Ключ объекта - пара (класс таблицы, первичный ключ). Методы асинхронные,
+    чтобы хранилище можно было заменить на общее для нескольких процессов.
+    """
+
+    async def get(self, key):
+        """Возвращает объект по ключу или None."""
+
+        raise NotImplementedError
+
+    async def set(self, key, value) -> None:  # noqa: A003
+        """Сохраняет объект по ключу."""
+
+        raise NotImplementedError
+
+    async def delete(self, key) -> None:
+        """Удаляет объект по ключу."""
+
+        raise NotImplementedError
+
+    async def clear(self, db=None) -> None:
+        """Удаляет все объекты таблицы `db` или весь кэш."""
+
+        raise NotImplementedError
+
+
+class MemoryCache(CacheBackend):
+    """Кэш объектов в памяти процесса с вытеснением по LRU и времени жизни."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0) -> None:
+        """
+        Инициализация кэша.
+
+        :param maxsize: максимальное количество объектов в кэше
+        :param ttl: время жизни объекта в кэше в секундах
+        """
+
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.__objs = OrderedDict()
+
+    async def get(self, key):
+        """Возвращает объект по ключу или None."""
+
+        item = self.__objs.get(key)
+        if item is None:
+            return None
+
+        expires, value = item
+        if expires < time.monotonic():
+            del self.__objs[key]
+            return None
+
+        self.__objs.move_to_end(key)
+
+        return value
+
+    async def set(self, key, value) -> None:  # noqa: A003
+        """Сохраняет объект по ключу."""
+
+        self.__objs[key] = (time.monotonic() + self.ttl, value)
+        self.__objs.move_to_end(key)
+
+        if len(self.__objs) > self.maxsize:
+            self.__objs.popitem(last=False)
+
+    async def delete(self, key) -> None:
+        """Удаляет объект по ключу."""
+
+        self.__objs.pop(key, None)
+
+    async def clear(self, db=None) -> None:
+        """Удаляет все объекты таблицы `db` или весь кэш."""
+
+        if db is None:
+            self.__objs.clear()
+            return
+
+        for key in [key for key in self.__objs if key[0] is db]:
+            del self.__objs[key]
+
+    def __len__(self) -> int:
+        return len(self.__objs)
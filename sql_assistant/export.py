@@ -0,0 +1,216 @@
+"""Запись строк выборки в файлы."""
+
+import contextlib
+import csv
+import datetime
+import json
+import os
+from decimal import Decimal
+
+# Точность и масштаб Parquet для `Numeric` без явно заданной точности
+DEFAULT_DECIMAL = (38, 10)
+
+
+class CsvWriter:
+    """Запись строк в CSV с заголовком из названий столбцов."""
+
+    binary = False
+
+    def __init__(self, file, columns: list[str], types: list = []) -> None:
+        """
+        Инициализация записи.
+
+        :param file: текстовый файл
+        :param columns: названия столбцов
+        :param types: типы SQLAlchemy столбцов (не используются)
+        """
+
+        self.writer = csv.writer(file)
+        self.writer.writerow(columns)
+
+    def write(self, rows: list) -> None:
+        """Запись пачки строк."""
+
+        self.writer.writerows(rows)
+
+    def close(self) -> None:
+        """Завершение записи."""
+
+
+class NdjsonWriter:
+    """Запись строк в NDJSON: по одному JSON-объекту на строку файла."""
+
+    binary = False
+
+    def __init__(self, file, columns: list[str], types: list = []) -> None:
+        """
+        Инициализация записи.
+
+        :param file: текстовый файл
+        :param columns: названия столбцов
+        :param types: типы SQLAlchemy столбцов (не используются)
+        """
+
+        self.file = file
+        self.columns = columns
+
+    def write(self, rows: list) -> None:
+        """Запись пачки строк."""
+
+        self.file.writelines(
+            json.dumps(dict(zip(self.columns, row)), default=str, ensure_ascii=False)
+            + '\n'
+            for row in rows
+        )
+
+    def close(self) -> None:
+        """Завершение записи."""
+
+
+class ParquetWriter:
+    """
+    Запись строк в Parquet, по группе строк на пачку. Нужен `pyarrow`.
+
+    Схема файла строится по типам столбцов, а не по первой пачке: столбец, в
+    первой пачке которого только NULL, иначе получил бы тип `null`.
+    """
+
+    binary = True
+
+    def __init__(self, file, columns: list[str], types: list = []) -> None:
+        """
+        Инициализация записи.
+
+        :param file: двоичный файл
+        :param columns: названия столбцов
+        :param types: типы SQLAlchemy столбцов, столбцы неизвестного типа
+            записываются строками
+
+        :raise Exception: не установлен `pyarrow`
+        """
+
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as exp:
+            msg = 'Для записи в Parquet необходимо установить `pyarrow`!'
+            raise Exception(msg) from exp
+
+        self.pa = pa
+        self.file = file
+        self.columns = columns
+        self.schema = pa.schema(
+            [
+                (column, self.arrow_type(sql_type))
+                for column, sql_type in zip(
+                    columns, types or [None] * len(columns), strict=True
+                )
+            ]
+        )
+        # Столбцы, значения которых записываются строками
+        self.text_columns = {
+            idx for idx, field in enumerate(self.schema) if field.type == pa.string()
+        }
+        self.writer = pq.ParquetWriter(file, self.schema)
+
+    def arrow_type(self, sql_type):
+        """
+        Тип Arrow по типу столбца SQLAlchemy.
+
+        :param sql_type: тип SQLAlchemy
+
+        :return: тип Arrow, для неизвестных типов - строка
+        """
+
+        pa = self.pa
+        try:
+            python_type = sql_type.python_type
+        except (AttributeError, NotImplementedError):
+            return pa.string()
+
+        if python_type is datetime.datetime:
+            timezone = 'UTC' if getattr(sql_type, 'timezone', False) else None
+            return pa.timestamp('us', tz=timezone)
+
+        if python_type is Decimal:
+            precision = getattr(sql_type, 'precision', None)
+            if precision is None:
+                return pa.decimal128(*DEFAULT_DECIMAL)
+            return pa.decimal128(precision, getattr(sql_type, 'scale', None) or 0)
+
+        types = {
+            bool: pa.bool_(),
+            int: pa.int64(),
+            float: pa.float64(),
+            bytes: pa.binary(),
+            datetime.date: pa.date32(),
+            datetime.time: pa.time64('us'),
+        }
+
+        return types.get(python_type, pa.string())
+
+    def write(self, rows: list) -> None:
+        """Запись пачки строк."""
+
+        data = {}
+        for idx, column in enumerate(self.columns):
+            values = [row[idx] for row in rows]
+            if idx in self.text_columns:
+                values = [to_text(value) for value in values]
+            data[column] = values
+
+        self.writer.write_table(self.pa.table(data, schema=self.schema))
+
+    def close(self) -> None:
+        """Завершение записи, без строк - файл с пустой таблицей."""
+
+        self.writer.close()
+
+
+def to_text(value) -> str | None:
+    """
+    Строковое представление значения столбца неизвестного для Parquet типа.
+
+    :param value: значение
+
+    :return: строка (словари и списки - JSON) или None
+    """
+
+    if value is None or isinstance(value, str):
+        return value
+
+    if isinstance(value, dict | list):
+        return json.dumps(value, default=str, ensure_ascii=False)
+
+    return str(value)
+
+
+# Классы записи по названию формата
+WRITERS = {
+    'csv': CsvWriter,
+    'ndjson': NdjsonWriter,
+    'parquet': ParquetWriter,
+}
+
+
+@contextlib.contextmanager
+def open_sink(sink, binary: bool = False):
+    """
+    Открытие файла по пути или использование переданного файлового объекта.
+
+    :param sink: путь к файлу или открытый файловый объект
+    :param binary: открыть файл в двоичном режиме
+
+    :return: файловый объект
+    """
+
+    if not isinstance(sink, str | os.PathLike):
+        yield sink
+        return
+
+    if binary:
+        with open(sink, 'wb') as file:  # noqa: PTH123
+            yield file
+    else:
+        with open(sink, 'w', encoding='utf-8', newline='') as file:  # noqa: PTH123
+            yield file
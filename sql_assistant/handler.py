@@ -1,8 +1,60 @@
+"""Вспомогательные функции работы с БД."""
+
+import base64
+import datetime
+import functools
+import json
+from decimal import Decimal
+from uuid import UUID
+
+from sqlalchemy import (
+    Sequence,
+    and_,
+    bindparam,
+    cast,
+    func,
+    insert,
+    nulls_last,
+    or_,
+    select,
+    tuple_,
+    update,
+)
+from sqlalchemy.orm import (
+    joinedload,
+    noload,
+    raiseload,
+    selectinload,
+    subqueryload,
+)
+from sqlalchemy.sql import expression, operators
+from sqlalchemy.sql.elements import UnaryExpression
+
+# Стратегии загрузки связей по их названию
+LOADERS = {
+    'selectin': selectinload,
+    'joined': joinedload,
+    'subquery': subqueryload,
+    'raise': raiseload,
+    'noload': noload,
+}
+
+# Типы, которые при декодировании курсора нужно восстановить из строки
+CURSOR_TYPES = {
+    datetime.datetime: datetime.datetime.fromisoformat,
+    datetime.date: datetime.date.fromisoformat,
+    datetime.time: datetime.time.fromisoformat,
+    Decimal: Decimal,
+    UUID: UUID,
+}
+
+
 def get_primary_keys_values(instance) -> dict:
     """
     Получение списка ключевых полей и их значений из экземпляра модели.
 
-    :param instance: экземпляр SQLAlchemy модели, для которого нужно получить ключевые поля
+    :param instance: экземпляр SQLAlchemy модели, для которого нужно получить
+        ключевые поля
 
     :return dict: словарь с именами ключевых полей (primary key) и их значениями
     """
@@ -14,3 +66,459 @@ def get_primary_keys_values(instance) -> dict:
             key_fields[column.name] = getattr(instance, column.name)
 
     return key_fields
+
+
+def short_repr(value, limit: int, total: int | None = None) -> str:
+    """
+    Строковое представление списка или словаря, ограниченное по длине.
+
+    :param value: список, кортеж или словарь
+    :param limit: максимальное количество выводимых элементов
+    :param total: полное количество элементов, если `value` уже обрезан
+
+    :return: строка вида `[1, 2, ... (+98)]`
+    """
+
+    total = len(value) if total is None else total
+    if not isinstance(value, list | tuple | dict) or total <= limit:
+        return str(value)
+
+    rest = f'... (+{total - limit})'
+    if isinstance(value, dict):
+        items = [f'{key!r}: {value[key]!r}' for key in list(value)[:limit]]
+        return '{' + ', '.join([*items, rest]) + '}'
+
+    return '[' + ', '.join([*map(repr, value[:limit]), rest]) + ']'
+
+
+def get_identity(instance):
+    """
+    Получение значения первичного ключа экземпляра модели.
+
+    :param instance: экземпляр SQLAlchemy модели
+
+    :return: значение ключа или кортеж значений для составного ключа
+    """
+
+    values = tuple(get_primary_keys_values(instance).values())
+
+    return values[0] if len(values) == 1 else values
+
+
+def identity_condition(db, ids: list):
+    """
+    Условие выборки объектов по списку значений первичного ключа.
+
+    :param db: класс таблицы
+    :param ids: значения ключа (кортежи значений для составного ключа)
+
+    :return: условие `pk IN (...)`
+    """
+
+    columns = [getattr(db, column.name) for column in db.__table__.primary_key]
+
+    if len(columns) == 1:
+        return columns[0].in_(ids)
+
+    return tuple_(*columns).in_([tuple(id_) for id_ in ids])
+
+
+@functools.cache
+def insert_returning(db):
+    """
+    Запрос вставки строки с возвратом созданного объекта.
+
+    Запрос не зависит от данных и строится один раз на таблицу.
+
+    :param db: класс таблицы
+
+    :return: запрос `INSERT ... RETURNING`
+    """
+
+    return insert(db).returning(db)
+
+
+def build_reserve_ids(db, table_name: str, count: int):
+    """
+    Построение запроса получения значений последовательности первичного ключа.
+
+    Только для PostgreSQL.
+
+    :param db: класс таблицы с одним целочисленным первичным ключом
+    :param table_name: название таблицы, экранированное для диалекта
+    :param count: количество значений
+
+    :return: запрос `SELECT nextval(...) FROM generate_series(1, count)`
+    """
+
+    (column,) = db.__table__.primary_key.columns
+
+    if isinstance(column.default, Sequence):
+        next_value = column.default.next_value()
+    else:
+        # Последовательность `serial` или `identity` столбца
+        sequence = func.pg_get_serial_sequence(table_name, column.name)
+        next_value = func.nextval(sequence)
+
+    return select(next_value).select_from(func.generate_series(1, count))
+
+
+def dedupe_rows(rows: list[dict], keys: list[str]) -> list[dict]:
+    """
+    Удаление строк с повторяющимися значениями ключа, остаётся последняя.
+
+    PostgreSQL не обновляет одну строку дважды за запрос `ON CONFLICT`.
+    Строки без значения какого-либо поля ключа не объединяются.
+
+    :param rows: список данных строк
+    :param keys: поля уникального ключа
+
+    :return: строки без повторов ключа в порядке первого появления ключа
+    """
+
+    unique = {}
+    for idx, row in enumerate(rows):
+        key = tuple(row.get(name) for name in keys)
+        unique[idx if None in key else key] = row
+
+    return list(unique.values())
+
+
+def build_bulk_update(db, fields) -> tuple:
+    """
+    Построение запроса обновления строк по первичному ключу для executemany.
+
+    :param db: класс таблицы
+    :param fields: названия обновляемых полей и полей первичного ключа
+
+    :return: запрос и функция преобразования строки данных в его параметры
+    """
+
+    table = db.__table__
+    keys = [column.name for column in table.primary_key]
+
+    query = (
+        update(table)
+        .where(*[table.c[key] == bindparam(f'pk_{key}') for key in keys])
+        .values({field: bindparam(field) for field in fields if field not in keys})
+    )
+
+    def make_params(row: dict) -> dict:
+        """Переименование полей ключа, чтобы они не попадали в `SET`."""
+
+        return {
+            (f'pk_{key}' if key in keys else key): value
+            for key, value in row.items()
+        }
+
+    return query, make_params
+
+
+def build_bulk_update_from_values(db, fields, rows: list[dict]):
+    """
+    Построение одного запроса `UPDATE ... FROM (VALUES ...)` для пачки строк.
+
+    В отличие от executemany, драйвер возвращает количество обновлённых строк
+    (asyncpg не сообщает `rowcount` после executemany). Только для PostgreSQL.
+
+    :param db: класс таблицы
+    :param fields: названия обновляемых полей и полей первичного ключа
+    :param rows: данные строк с одинаковым набором полей `fields`
+
+    :return: запрос обновления
+    """
+
+    table = db.__table__
+    keys = [key.name for key in table.primary_key]
+
+    data = expression.values(
+        *[expression.column(field, table.c[field].type) for field in fields],
+        name='data',
+    ).data([tuple(row[field] for field in fields) for row in rows])
+
+    def typed(field: str):
+        """Значение из VALUES с типом столбца: NULL в VALUES не типизирован."""
+
+        return cast(data.c[field], table.c[field].type)
+
+    return (
+        update(table)
+        .where(*[table.c[key] == typed(key) for key in keys])
+        .values({field: typed(field) for field in fields if field not in keys})
+    )
+
+
+def build_load_options(db, load) -> list:
+    """
+    Построение опций загрузки связей.
+
+    :param db: класс таблицы
+    :param load: список опций (`selectinload(...)` и т.п.) и названий связей
+        (загружаются через `selectinload`), либо словарь
+        `{'связь.вложенная_связь': 'selectin' | 'joined' | 'subquery' | 'raise'}`
+
+    :raise Exception: неизвестная стратегия загрузки
+
+    :return: список опций загрузки
+    """
+
+    items = (
+        load.items()
+        if isinstance(load, dict)
+        else [(item, 'selectin') if isinstance(item, str) else item for item in load]
+    )
+
+    options = []
+    for item in items:
+        if not isinstance(item, tuple):
+            options.append(item)  # Готовая опция загрузки
+            continue
+
+        path, strategy = item
+        if strategy not in LOADERS:
+            msg = f'Неизвестная стратегия загрузки `{strategy}`!'
+            raise Exception(msg)
+
+        option, model = None, db
+        for name in path.split('.'):
+            attr = getattr(model, name)
+            option = (
+                LOADERS[strategy](attr)
+                if option is None
+                else getattr(option, LOADERS[strategy].__name__)(attr)
+            )
+            model = attr.property.mapper.class_
+
+        options.append(option)
+
+    return options
+
+
+def build_select(  # noqa: C901, PLR0912
+    db,
+    where: list = [],
+    order_by: list = [],
+    group_by: list = [],
+    join_lst: list = [],
+    aggregate: dict = {},
+    fields: list = [],
+):
+    """
+    Построение запроса выборки.
+
+    :param db: класс таблицы из которой необходимо получить данные
+    :param where: условия выборки
+    :param order_by: параметры сортировки
+    :param group_by: параметры группировки
+    :param join_lst: список джойнов
+    :param aggregate: словарь с агрегатными функциями
+    :param fields: поля для выборки
+
+    :return: запрос выборки
+    """
+
+    query = select(*fields) if fields else select(db)
+
+    if join_lst:
+        query = query.select_from(db)
+        for data in join_lst:
+            if data.get('onclause'):
+                if data.get('type') == 'left':
+                    query = query.outerjoin(data['target'], data['onclause'])
+                else:
+                    query = query.join(data['target'], data['onclause'])
+            elif data.get('type') == 'left':
+                query = query.outerjoin(data['target'])
+            else:
+                query = query.join(data['target'])
+
+    if where:
+        query = query.where(*where)
+
+    if group_by:
+        query = query.group_by(*group_by)
+
+    if aggregate:
+        for column, func in aggregate.items():
+            query = query.add_columns(func(getattr(db, column)).label(column))
+
+    if order_by:
+        query = query.order_by(*order_by)
+
+    return query
+
+
+def build_aggregate(
+    db,
+    where: list = [],
+    group_by: list = [],
+    join_lst: list = [],
+    metrics: dict = {},
+    having: list = [],
+    order_by: list = [],
+):
+    """
+    Построение запроса агрегации без выборки строк таблицы.
+
+    :param db: класс таблицы, по которой считаются агрегаты
+    :param where: условия выборки
+    :param group_by: параметры группировки, попадающие в результат
+    :param join_lst: список джойнов
+    :param metrics: словарь `{название: выражение}` агрегатных выражений,
+        например `{'total': func.count(), 'max_id': func.max(User.id)}`
+    :param having: условия на сгруппированные строки
+    :param order_by: параметры сортировки групп
+
+    :return: запрос агрегации
+    """
+
+    columns = [
+        *group_by,
+        *(expression.label(label) for label, expression in metrics.items()),
+    ]
+    query = build_select(db, where, order_by, group_by, join_lst, {}, columns)
+
+    if having:
+        query = query.having(*having)
+
+    # Без джойнов `build_select` не задаёт таблицу, а выражения вроде
+    # `func.count()` её не содержат
+    return query if join_lst else query.select_from(db)
+
+
+def compile_positional(query, dialect) -> tuple[str, list]:
+    """
+    Компиляция запроса в SQL с позиционными параметрами для вызова драйвера.
+
+    Списки `IN (...)` раскрываются в отдельные параметры: без
+    `render_postcompile` в SQL остаются заглушки `__[POSTCOMPILE_...]`.
+
+    :param query: запрос
+    :param dialect: диалект БД с позиционными параметрами (asyncpg)
+
+    :return: SQL и список значений параметров по порядку
+    """
+
+    compiled = query.compile(
+        dialect=dialect, compile_kwargs={'render_postcompile': True}
+    )
+
+    return compiled.string, [compiled.params[name] for name in compiled.positiontup]
+
+
+def split_order(expression) -> tuple:
+    """
+    Разбор параметра сортировки на столбец и направление.
+
+    :param expression: столбец или `столбец.desc()`/`столбец.asc()`
+
+    :return: столбец и признак сортировки по убыванию
+    """
+
+    if isinstance(expression, UnaryExpression):
+        descending = expression.modifier is operators.desc_op
+        return expression.element, descending
+
+    return expression, False
+
+
+def is_nullable(column) -> bool:
+    """
+    Может ли столбец содержать NULL.
+
+    :param column: столбец таблицы
+
+    :return: столбец допускает NULL
+    """
+
+    return getattr(column.expression, 'nullable', True)
+
+
+def keyset_order(column, descending: bool):
+    """
+    Параметр сортировки keyset-пагинации.
+
+    NULL сортируются последними при любом направлении, одинаково во всех БД:
+    по умолчанию PostgreSQL и SQLite располагают их по-разному.
+
+    :param column: столбец сортировки
+    :param descending: сортировка по убыванию
+
+    :return: выражение сортировки
+    """
+
+    clause = column.desc() if descending else column
+
+    return nulls_last(clause) if is_nullable(column) else clause
+
+
+def keyset_condition(order: list[tuple], values: list):
+    """
+    Условие выборки строк, следующих за курсором.
+
+    Для сортировки `(a, b)` строится `a > :a OR (a = :a AND b > :b)`, с учётом
+    направления сортировки каждого столбца. Порядок NULL соответствует
+    `keyset_order`: после значения следуют NULL, после NULL - ничего.
+
+    :param order: список пар (столбец, сортировка по убыванию)
+    :param values: значения столбцов последней строки предыдущей страницы
+
+    :return: условие выборки
+    """
+
+    equals = []
+    conditions = []
+    for (column, descending), value in zip(order, values, strict=True):
+        if value is not None:
+            compare = column < value if descending else column > value
+            if is_nullable(column):
+                compare = or_(compare, column.is_(None))
+            conditions.append(and_(*equals, compare))
+
+        equals.append(column.is_(None) if value is None else column == value)
+
+    return or_(*conditions)
+
+
+def encode_cursor(values: list) -> str:
+    """
+    Кодирование значений последней строки страницы в непрозрачный токен.
+
+    :param values: значения столбцов сортировки
+
+    :return: токен продолжения
+    """
+
+    data = json.dumps(values, default=str, separators=(',', ':'))
+
+    return base64.urlsafe_b64encode(data.encode()).decode()
+
+
+def decode_cursor(token: str, columns: list) -> list:
+    """
+    Декодирование токена продолжения.
+
+    :param token: токен продолжения
+    :param columns: столбцы сортировки, для восстановления типов значений
+
+    :raise Exception: токен не соответствует сортировке
+
+    :return: значения столбцов сортировки
+    """
+
+    values = json.loads(base64.urlsafe_b64decode(token.encode()))
+
+    if len(values) != len(columns):
+        msg = 'Токен продолжения не соответствует сортировке!'
+        raise Exception(msg)
+
+    for idx, column in enumerate(columns):
+        try:
+            python_type = column.type.python_type
+        except NotImplementedError:
+            continue
+
+        if values[idx] is not None and python_type in CURSOR_TYPES:
+            values[idx] = CURSOR_TYPES[python_type](values[idx])
+
+    return values
@@ -0,0 +1,60 @@
+"""Выдача первичных ключей из заранее зарезервированных блоков."""
+
+import asyncio
+from collections import deque
+
+
+class IdAllocator:
+    """
+    Выдаёт id из блоков последовательности, резервируемых `reserve_ids`.
+
+    Один запрос к последовательности обслуживает `block_size` созданий
+    объектов. Неиспользованные id блока пропадают. Только для PostgreSQL.
+    """
+
+    def __init__(self, sas, block_size: int = 100) -> None:
+        """
+        Инициализация выдачи id.
+
+        :param sas: помощник работы с БД
+        :param block_size: количество id, резервируемых одним запросом
+        """
+
+        self.sas = sas
+        self.block_size = block_size
+        self.__blocks = {}
+        self.__locks = {}
+
+    async def take(self, db, count: int = 1) -> list[int]:
+        """
+        Возвращает `count` id таблицы, при нехватке резервируя новый блок.
+
+        :param db: класс таблицы с одним целочисленным первичным ключом
+        :param count: количество id
+
+        :return: список id
+        """
+
+        lock = self.__locks.setdefault(db, asyncio.Lock())
+
+        async with lock:
+            block = self.__blocks.setdefault(db, deque())
+
+            if len(block) < count:
+                size = max(self.block_size, count - len(block))
+                block.extend(await self.sas.reserve_ids(db, size))
+
+            return [block.popleft() for _ in range(count)]
+
+    async def next_id(self, db) -> int:
+        """
+        Возвращает следующий id таблицы.
+
+        :param db: класс таблицы с одним целочисленным первичным ключом
+
+        :return: id
+        """
+
+        (id_,) = await self.take(db)
+
+        return id_
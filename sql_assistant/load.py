@@ -0,0 +1,176 @@
+"""Чтение источников строк для массовой загрузки."""
+
+import csv
+import datetime
+import json
+import os
+from collections.abc import Iterator
+from decimal import Decimal
+from pathlib import Path
+
+from sqlalchemy import column, select, table
+
+# Строковые значения, считающиеся истиной для булевых столбцов
+TRUE_VALUES = {'true', 't', '1', 'yes', 'y'}
+# Типы, восстанавливаемые из ISO-строки
+ISO_TYPES = (datetime.datetime, datetime.date, datetime.time)
+
+
+def column_types(db) -> dict:
+    """
+    Python-типы столбцов таблицы по ключам столбцов.
+
+    :param db: класс таблицы
+
+    :return: словарь `{ключ столбца: тип}`, без столбцов с неизвестным типом
+    """
+
+    types = {}
+    for table_column in db.__table__.columns:
+        try:
+            types[table_column.key] = table_column.type.python_type
+        except NotImplementedError:
+            continue
+
+    return types
+
+
+def coerce_value(python_type, value):
+    """
+    Преобразование значения из файла к типу столбца.
+
+    :param python_type: тип столбца
+    :param value: значение из CSV (строка) или NDJSON
+
+    :return: преобразованное значение, пустая строка нестрокового столбца - None
+    """
+
+    if value is None or isinstance(value, python_type):
+        return value
+
+    if value == '':
+        return None
+
+    if python_type is bool:
+        return str(value).lower() in TRUE_VALUES
+
+    if python_type in ISO_TYPES:
+        return python_type.fromisoformat(value)
+
+    if python_type is Decimal:
+        return Decimal(str(value))
+
+    return python_type(value)
+
+
+def read_file(path) -> Iterator[dict]:
+    """
+    Построчное чтение файла CSV (с заголовком) или NDJSON.
+
+    :param path: путь к файлу `.csv`, `.ndjson` или `.jsonl`
+
+    :raise Exception: неизвестное расширение файла
+
+    :return: генератор словарей строк
+    """
+
+    path = Path(path)
+    suffix = path.suffix.lower()
+
+    if suffix not in {'.csv', '.ndjson', '.jsonl'}:
+        msg = f'Формат файла `{path.name}` не поддерживается!'
+        raise Exception(msg)
+
+    with path.open(encoding='utf-8', newline='') as file:
+        if suffix == '.csv':
+            yield from csv.DictReader(file)
+        else:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+
+
+async def iter_chunks(source, chunk_size: int, db):
+    """
+    Пачки строк из файла, итерируемого или асинхронно итерируемого объекта.
+
+    Значения строк из файлов преобразуются к типам столбцов таблицы.
+
+    :param source: путь к файлу или (асинхронно) итерируемый объект словарей
+    :param chunk_size: количество строк в пачке
+    :param db: класс таблицы
+
+    :return: асинхронный генератор списков словарей
+    """
+
+    if isinstance(source, str | os.PathLike):
+        types = column_types(db)
+        source = (
+            {
+                key: coerce_value(types[key], value) if key in types else value
+                for key, value in row.items()
+            }
+            for row in read_file(source)
+        )
+
+    chunk = []
+
+    if hasattr(source, '__aiter__'):
+        async for row in source:
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+    else:
+        for row in source:
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+
+    if chunk:
+        yield chunk
+
+
+def build_merge(
+    insert_dialect,
+    db,
+    staging_name: str,
+    columns: list[str],
+    conflict_keys: list[str] | None = None,
+    update_fields: list[str] | None = None,
+):
+    """
+    Построение запроса переноса строк из промежуточной таблицы в целевую.
+
+    Столбцы целевой таблицы, отсутствующие в промежуточной, получают значения
+    по умолчанию модели.
+
+    :param insert_dialect: функция `insert` диалекта с поддержкой `ON CONFLICT`
+    :param db: класс целевой таблицы
+    :param staging_name: название промежуточной таблицы
+    :param columns: названия загружаемых столбцов
+    :param conflict_keys: поля уникального ключа, по которым ищется конфликт
+        (None - без `ON CONFLICT`)
+    :param update_fields: поля, обновляемые при конфликте (по умолчанию все
+        столбцы, кроме `conflict_keys`; пустой список - не обновлять)
+
+    :return: запрос `INSERT ... SELECT ... [ON CONFLICT]`
+    """
+
+    staging = table(staging_name, *[column(name) for name in columns])
+    query = insert_dialect(db.__table__).from_select(columns, select(*staging.c))
+
+    if conflict_keys is None:
+        return query
+
+    if update_fields is None:
+        update_fields = [name for name in columns if name not in conflict_keys]
+
+    if not update_fields:
+        return query.on_conflict_do_nothing(index_elements=conflict_keys)
+
+    return query.on_conflict_do_update(
+        index_elements=conflict_keys,
+        set_={name: query.excluded[name] for name in update_fields},
+    )
@@ -1,39 +1,171 @@
 """Работа с БД."""
 
+import asyncio
 import contextlib
+import functools
+import importlib
+import itertools
+import logging
 import re
 import sys
-
-import loguru
-from sqlalchemy import select, update
+import time
+import uuid
+import weakref
+from contextvars import ContextVar
+from typing import NoReturn
+
+from sqlalchemy import event, func, insert, inspect, select, update
+from sqlalchemy.engine import make_url
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import DeclarativeMeta, sessionmaker
+from sqlalchemy.orm.exc import UnmappedColumnError
+
+from sql_assistant.batch import BatchLoader
+from sql_assistant.buffer import WriteBuffer
+from sql_assistant.cache import CacheBackend, QueryCache
+from sql_assistant.export import WRITERS, open_sink
+from sql_assistant.handler import (
+    build_aggregate,
+    build_bulk_update,
+    build_bulk_update_from_values,
+    build_load_options,
+    build_reserve_ids,
+    build_select,
+    compile_positional,
+    decode_cursor,
+    dedupe_rows,
+    encode_cursor,
+    get_identity,
+    get_primary_keys_values,
+    identity_condition,
+    insert_returning,
+    keyset_condition,
+    keyset_order,
+    short_repr,
+    split_order,
+)
+from sql_assistant.load import build_merge, iter_chunks
+from sql_assistant.metrics import StatsRegistry, count_rows
+from sql_assistant.retry import RetryPolicy
+from sql_assistant.spec import QuerySpec
+
+# Модули диалектов с `insert ... on_conflict_do_update`, импортируемые при
+# первом `upsert_objs`
+UPSERT_DIALECTS = {
+    'postgresql': 'sqlalchemy.dialects.postgresql',
+    'sqlite': 'sqlalchemy.dialects.sqlite',
+}
+
+# Максимальное количество параметров одного запроса (ограничение asyncpg)
+MAX_BIND_PARAMS = 32767
+
+# Стратегии выбора реплики для чтения
+REPLICA_STRATEGIES = ('round_robin', 'least_loaded')
+
+# Движки, на которые подписаны обработчики медленных запросов: одна пара
+# обработчиков на движок, сколько бы помощников с ним ни создавалось
+SLOW_QUERY_ENGINES = weakref.WeakSet()
+
+# Движки SQLite, на которых включены точки сохранения `transaction()`
+SQLITE_SAVEPOINT_ENGINES = weakref.WeakSet()
+
+
+def sqlite_connect(dbapi_connection, connection_record):  # noqa: ARG001
+    """Отключает собственное управление транзакциями драйвера SQLite."""
+
+    dbapi_connection.isolation_level = None
+
+
+def sqlite_begin(conn):
+    """Открывает транзакцию SQLite явно, до первой точки сохранения."""
+
+    # Транзакция уже открыта, если тот же рецепт подключён и в проекте
+    if not conn.connection.driver_connection.in_transaction:
+        conn.exec_driver_sql('BEGIN')
+
+
+def before_cursor_execute(
+    conn, cursor, statement, parameters, context, *args  # noqa: ARG001
+):
+    """Запоминает время начала запроса в контексте его выполнения."""
+
+    if context is not None:
+        context.sql_assistant_start = time.perf_counter()
+
+
+def after_cursor_execute(
+    conn, cursor, statement, parameters, context, *args  # noqa: ARG001
+):
+    """Передаёт время выполнения запроса помощнику, открывшему его сессию."""
+
+    start = getattr(context, 'sql_assistant_start', None)
+    if start is None:
+        return
+
+    # Слабая ссылка на помощника в параметрах выполнения его сессий
+    ref = context.execution_options.get('sql_assistant')
+    assistant = ref() if ref is not None else None
+    if assistant is not None:
+        elapsed = time.perf_counter() - start
+        assistant._log_slow_query(elapsed, statement)  # noqa: SLF001
+
+
+@functools.cache
+def default_log():
+    """
+    Логгер loguru с файлом `file.log`, добавляемым один раз на процесс.
+
+    :return: логгер
+    """
+
+    from loguru import logger
+
+    logger.add(
+        'file.log',
+        rotation='10 MB',
+        compression='zip',
+        level='TRACE',
+        format='{name:25}| {time} | {level:8} | {message}',
+    )
+
+    msg = 'Создан собственный `logger`, т.к. не был передан `logger` проекта!'
+    logger.warning(msg)
+
+    return logger
 
 
 class Storage:
     __log = None
     __base = None
     __async_session = None
+    __replicas = ()
+    __engines = ()
 
-    def __init__(self, base=None, async_session=None, log=None) -> None:
+    def __init__(
+        self, base=None, async_session=None, log=None, replicas=None
+    ) -> None:
         """
         Инициализация класса.
 
         :param base: декларативная база
         :param async_session: генератор асинхронных сессий подключений к БД
         :param log: объект логирования
+        :param replicas: генераторы асинхронных сессий реплик БД для чтения
         """
 
-        self.validate(base=base, async_session=async_session, log=log)
+        self.validate(
+            base=base, async_session=async_session, log=log, replicas=replicas
+        )
 
-    def validate(self, base, async_session, log):
+    def validate(self, base, async_session, log, replicas=None):
         """Валидация переданных данных."""
 
         results = [
             self.log_validate(log),
             self.base_validate(base),
             self.async_session_validate(async_session),
+            self.replicas_validate(replicas),
         ]
 
         if not any(results):
@@ -45,19 +177,7 @@ class Storage:
         """Валидация подключения функции логов проекта."""
 
         if log is None:
-            log = loguru.logger
-            log.add(
-                'file.log',
-                rotation='10 MB',
-                compression='zip',
-                level='TRACE',
-                format='{name:25}| {time} | {level:8} | {message}',
-            )
-
-            msg = (
-                'Создан собственный `logger`, т.к. не был передан `logger` проекта!'
-            )
-            log.warning(msg)
+            log = default_log()
 
         self.__log = log
 
@@ -66,7 +186,7 @@ class Storage:
     def base_validate(self, base):
         """Валидация БД."""
 
-        is_base = isinstance(base, type(declarative_base()))
+        is_base = isinstance(base, DeclarativeMeta)
 
         if not is_base:
             msg = 'Не был передан `Base` проекта!'
@@ -79,7 +199,7 @@ class Storage:
     def async_session_validate(self, async_session):
         """Валидация сессии подключения к БД асинхронно."""
 
-        is_async_session = isinstance(async_session, type(sessionmaker()))
+        is_async_session = isinstance(async_session, sessionmaker)
 
         if not is_async_session:
             msg = 'Не был передан `async_session` проекта!'
@@ -89,6 +209,20 @@ class Storage:
 
         return is_async_session
 
+    def replicas_validate(self, replicas):
+        """Валидация сессий подключения к репликам БД асинхронно."""
+
+        replicas = list(replicas or [])
+        is_replicas = all(isinstance(replica, sessionmaker) for replica in replicas)
+
+        if not is_replicas:
+            msg = 'Были переданы не верные `replicas` проекта!'
+            self.__log.exception(msg)
+        else:
+            self.__replicas = replicas
+
+        return is_replicas
+
     @property
     def log(self):
         return self.__log
@@ -101,25 +235,325 @@ class Storage:
     def async_session(self):
         return self.__async_session
 
+    @property
+    def replicas(self):
+        return self.__replicas
+
+    @property
+    def engine(self):
+        """Движок, созданный `from_url` или привязанный к `async_session`."""
+
+        if self.__engines:
+            return self.__engines[0]
+
+        return self.__async_session.kw.get('bind')
+
+    # == Пул подключений ============================================================
+    @classmethod
+    def from_url(
+        cls,
+        url,
+        base=None,
+        log=None,
+        *,
+        pool_size: int | None = None,
+        max_overflow: int | None = None,
+        pool_recycle: int = -1,
+        pool_pre_ping: bool = True,
+        statement_cache_size: int | None = None,
+        engine_kwargs: dict = {},
+        replica_urls: list = [],
+        **kwargs,
+    ):
+        """
+        Создание экземпляра, владеющего собственным движком и пулом подключений.
+
+        Движки закрываются методом `dispose`.
+
+        :param url: строка подключения к БД
+        :param base: декларативная база
+        :param log: объект логирования
+        :param pool_size: количество постоянных соединений пула
+            (None - по умолчанию SQLAlchemy)
+        :param max_overflow: количество соединений сверх `pool_size`
+            (None - по умолчанию SQLAlchemy)
+        :param pool_recycle: время жизни соединения в секундах (-1 - без ограничения)
+        :param pool_pre_ping: проверять соединение перед выдачей из пула
+        :param statement_cache_size: размер кэша подготовленных запросов asyncpg
+            (0 - отключить, например, при работе через pgbouncer)
+        :param engine_kwargs: дополнительные параметры `create_async_engine`
+        :param replica_urls: строки подключения к репликам БД, движки которых
+            создаются с теми же параметрами
+        :param kwargs: параметры конструктора класса
+
+        :return: экземпляр класса
+        """
+
+        options = {
+            'pool_recycle': pool_recycle,
+            'pool_pre_ping': pool_pre_ping,
+        }
+        if pool_size is not None:
+            options['pool_size'] = pool_size
+        if max_overflow is not None:
+            options['max_overflow'] = max_overflow
+
+        options |= engine_kwargs
+
+        engines = []
+        for engine_url in [url, *replica_urls]:
+            engine_url = make_url(engine_url)
+            engine_options = options
+
+            if (
+                statement_cache_size is not None
+                and engine_url.get_driver_name() == 'asyncpg'
+            ):
+                # Кэш asyncpg и кэш подготовленных запросов диалекта SQLAlchemy
+                engine_url = engine_url.update_query_dict(
+                    {'prepared_statement_cache_size': str(statement_cache_size)}
+                )
+                # Параметры подключения из `engine_kwargs` сохраняются
+                connect_args = options.get('connect_args', {}) | {
+                    'statement_cache_size': statement_cache_size
+                }
+                engine_options = options | {'connect_args': connect_args}
+
+            engines.append(create_async_engine(engine_url, **engine_options))
+
+        async_session, *replicas = [
+            sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+            for engine in engines
+        ]
+
+        instance = cls(base, async_session, log, replicas=replicas, **kwargs)
+        instance.__engines = engines
+
+        return instance
+
+    def pool_stats(self) -> dict:
+        """
+        Статистика использования пула подключений.
+
+        :return: словарь с классом пула и, если пул их поддерживает, размером,
+            количеством свободных, выданных и сверхлимитных соединений
+        """
+
+        pool = self.engine.pool
+        stats = {'pool': type(pool).__name__}
+
+        for name in ('size', 'checkedin', 'checkedout', 'overflow'):
+            method = getattr(pool, name, None)
+            if method is not None:
+                stats[name] = method()
+
+        return stats
+
+    async def dispose(self) -> None:
+        """Закрытие соединений движков, созданных `from_url`."""
+
+        for engine in self.__engines:
+            await engine.dispose()
+
 
 class SqlAssistant(Storage):
     """Класс-помощник работы с БД."""
 
+    def __init__(
+        self,
+        base=None,
+        async_session=None,
+        log=None,
+        query_cache_size: int = 128,
+        obj_cache: CacheBackend | None = None,
+        coalesce: bool = False,
+        log_limit: int = 10,
+        metrics: StatsRegistry | None = None,
+        slow_query_threshold: float | None = None,
+        replicas: list | None = None,
+        replica_strategy: str = 'round_robin',
+        read_your_writes: float = 1.0,
+        retry: RetryPolicy | None = None,
+        retry_methods: dict = {},
+    ) -> None:
+        """
+        Инициализация класса.
+
+        :param base: декларативная база
+        :param async_session: генератор асинхронных сессий подключений к БД
+        :param log: объект логирования
+        :param query_cache_size: размер кэша запросов выборки, построенных с
+            названием формы `shape` (0 - не кэшировать)
+        :param obj_cache: кэш объектов, получаемых через `get_obj`
+            (например, `MemoryCache`), None - не кэшировать
+        :param coalesce: объединять одновременные вызовы `get_obj` без сессии в
+            один запрос `WHERE pk IN (...)`
+        :param log_limit: максимальное количество id или полей данных,
+            выводимых в отладочные логи
+        :param metrics: хранилище статистики вызовов методов (например,
+            `StatsRegistry`), None - не собирать статистику
+        :param slow_query_threshold: время выполнения запроса в секундах, после
+            которого его SQL выводится в лог как медленный, None - не выводить
+        :param replicas: генераторы асинхронных сессий реплик БД, на которых
+            открываются новые сессии методов чтения
+        :param replica_strategy: выбор реплики: `round_robin` - по очереди,
+            `least_loaded` - с наименьшим количеством открытых сессий
+        :param read_your_writes: время в секундах после записи, в течение
+            которого чтение в том же контексте выполняется на основной БД
+            (0 - всегда читать с реплик)
+        :param retry: правила повтора методов при временных ошибках БД
+            (`RetryPolicy`), None - не повторять
+        :param retry_methods: правила повтора отдельных методов по их названию,
+            заменяющие `retry` (None - не повторять метод)
+
+        :raise Exception: неизвестная стратегия выбора реплики
+        """
+
+        if replica_strategy not in REPLICA_STRATEGIES:
+            msg = f'Неизвестная стратегия выбора реплики `{replica_strategy}`!'
+            raise Exception(msg)
+
+        super().__init__(
+            base=base, async_session=async_session, log=log, replicas=replicas
+        )
+
+        self.query_cache = QueryCache(query_cache_size) if query_cache_size else None
+        self.obj_cache = obj_cache
+        self.log_limit = log_limit
+        self.batch_loader = (
+            BatchLoader(self._fetch_objs_by_ids) if coalesce else None
+        )
+        # Сессия и параметры транзакции, открытой через `transaction()`
+        self.__transaction = ContextVar('sql_assistant_transaction', default=None)
+        # Сессия, открытая через `session_scope()`
+        self.__scope = ContextVar('sql_assistant_session', default=None)
+        self.metrics = metrics
+        self.slow_query_threshold = slow_query_threshold
+        # Буферы записи, закрываемые в `close()`
+        self.__buffers = []
+        self.replica_strategy = replica_strategy
+        self.read_your_writes = read_your_writes
+        # Время последней записи в текущем контексте (`time.monotonic()`)
+        self.__last_write = ContextVar('sql_assistant_last_write', default=None)
+        self.__replica_counter = itertools.count()
+        # Количество открытых сессий на каждой реплике
+        self.__replica_load = [0] * len(self.replicas)
+        # Время последнего сброса кэша объектов таблицы после записи
+        self.__table_writes = {}
+        self.retry = retry
+        self.retry_methods = retry_methods
+        # Движки с параметром выполнения `sql_assistant` для сессий помощника
+        self.__slow_query_binds = {}
+
+        self._enable_sqlite_savepoints()
+        if slow_query_threshold is not None:
+            self._listen_slow_queries()
+
     # == Декораторы класса ==========================================================
     @staticmethod
-    def check_session_param(func):
-        """Декоратор проверки сессии."""
-
-        async def wrapper(self, *args, session=None, **kwargs):
-            """Проверка сессии и запуск логики."""
-            # Попытка получить значение параметра session из kwargs
-            if not isinstance(session, AsyncSession):
-                # Генерация session
-                async with self.async_session() as session:
-                    result = await func(self, *args, session=session, **kwargs)
-            else:
-                # Использование переданного session
-                result = await func(self, *args, session=session, **kwargs)
+    def check_session_param(func=None, *, read: bool = False):
+        """
+        Декоратор проверки сессии.
+
+        :param read: метод только читает данные, и новую сессию можно открыть на
+            реплике (`@check_session_param(read=True)`)
+        """
+
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(self, *args, session=None, **kwargs):
+                """Проверка сессии и запуск логики."""
+                async with (
+                    self._get_session(session, read=read) as session,
+                    self._savepoint(session),
+                ):
+                    return await func(self, *args, session=session, **kwargs)
+
+            return wrapper
+
+        return decorator if func is None else decorator(func)
+
+    @staticmethod
+    def check_retry(func=None, *, write: bool = False):
+        """
+        Декоратор повтора при временных ошибках БД.
+
+        Располагается над остальными декораторами метода. Метод повторяется
+        только в новой сессии: если передана сессия или открыты
+        `transaction()`/`session_scope()`, ошибка возвращается вызывающему коду.
+
+        :param write: метод изменяет данные и повторяется только после ошибок
+            сериализации и взаимной блокировки (`@check_retry(write=True)`)
+        """
+
+        def decorator(func):
+            name = func.__name__
+
+            @functools.wraps(func)
+            async def wrapper(self, *args, error=True, session=None, **kwargs):
+                """Повтор метода с растущей случайной задержкой."""
+                policy = self.retry_methods.get(name, self.retry)
+                if (
+                    policy is None
+                    or session is not None
+                    or self._shared_session() is not None
+                ):
+                    return await func(
+                        self, *args, error=error, session=session, **kwargs
+                    )
+
+                attempt = 1
+                while True:
+                    try:
+                        return await func(self, *args, **kwargs)
+                    except Exception as exp:
+                        if not policy.should_retry(exp, attempt, write=write):
+                            # Возвращать ли ошибку при её возникновении
+                            if error:
+                                raise
+                            return None
+
+                        delay = policy.delay(attempt)
+                        self.log.warning(
+                            f'Повтор `{name}` после временной ошибки БД '
+                            f'(попытка {attempt + 1}/{policy.attempts} через '
+                            f'{delay:.3f} с): {exp!r}'
+                        )
+                        if self.metrics is not None:
+                            self.metrics.record_retry(name, delay)
+
+                    await asyncio.sleep(delay)
+                    attempt += 1
+
+            return wrapper
+
+        return decorator if func is None else decorator(func)
+
+    @staticmethod
+    def check_metrics(func):
+        """Декоратор сбора статистики вызова."""
+
+        name = func.__name__
+
+        @functools.wraps(func)
+        async def wrapper(self, *args, error=True, **kwargs):
+            """Замер времени выполнения и количества строк."""
+            if self.metrics is None:
+                return await func(self, *args, error=error, **kwargs)
+
+            start = time.perf_counter()
+            try:
+                result = await func(self, *args, **kwargs)
+            except Exception:
+                self.metrics.record(name, time.perf_counter() - start, error=True)
+                # Возвращать ли ошибку при её возникновении
+                if error:
+                    raise
+                return None
+
+            self.metrics.record(
+                name, time.perf_counter() - start, count_rows(result)
+            )
 
             return result
 
@@ -129,6 +563,7 @@ class SqlAssistant(Storage):
     def check_error(func):
         """Декоратор проверки возврата ошибок."""
 
+        @functools.wraps(func)
         async def wrapper(self, *args, error=True, **kwargs):
             """Проверка возврата ошибок."""
             # Возвращать ли ошибку при её возникновении
@@ -143,236 +578,1897 @@ class SqlAssistant(Storage):
 
         return wrapper
 
-    # == Запросы в БД ===============================================================
-    # = Select запросы ==============================================================
-    @check_session_param
-    @check_error
-    async def get_obj(self, db, id_: int, session=None):
+    # == Сессии =====================================================================
+    @contextlib.asynccontextmanager
+    async def _get_session(self, session=None, read: bool = False):
         """
-        Возвращает объект по id.
+        Возвращает переданную сессию, сессию открытой транзакции или области
+        `session_scope()`, либо новую.
 
-        :param db: класс таблицы, из которой необходимо получить объект
-        :param id_: id объекта
         :param session: сессия работы с БД
+        :param read: новую сессию можно открыть на реплике
+        """
 
-        :raise Exception: программная ошибка
+        shared = self._shared_session()
 
-        :return: объект таблицы
+        # Попытка получить значение параметра session из kwargs
+        if isinstance(session, AsyncSession):
+            # Использование переданного session
+            yield session
+        elif shared is not None:
+            # Использование сессии транзакции или области
+            yield shared
+        else:
+            # Генерация session
+            async with self._new_session(read) as session:
+                yield session
+
+    @contextlib.asynccontextmanager
+    async def _new_session(self, read: bool = False):
+        """
+        Новая сессия с замером времени получения соединения из пула.
+
+        :param read: открыть сессию на реплике, если они переданы и в текущем
+            контексте не было недавней записи
         """
 
+        replica = self._choose_replica() if read else None
+        if replica is None:
+            async_session = self.async_session
+        else:
+            async_session = self.replicas[replica]
+            self.__replica_load[replica] += 1
+
         try:
-            obj = await session.get(db, id_)
+            async with self._open_session(async_session) as session:
+                if self.metrics is not None:
+                    # Получение соединения из пула, которое иначе произошло бы
+                    # при первом запросе
+                    start = time.perf_counter()
+                    await session.connection()
+                    self.metrics.record('session', time.perf_counter() - start)
+
+                yield session
+        finally:
+            if replica is not None:
+                self.__replica_load[replica] -= 1
+
+    def _open_session(self, async_session):
+        """
+        Новая сессия генератора, запросы которой выводятся в лог медленных
+        запросов этого помощника.
 
-            assert obj, f'Объект с id={id_} не найден!'
+        :param async_session: генератор асинхронных сессий
 
-        except Exception as exp:
-            msg = str(exp)
-            self.log.exception(msg)
+        :return: сессия работы с БД
+        """
 
-            await session.rollback()
-            raise exp
+        bind = self.__slow_query_binds.get(async_session)
 
-        else:
-            return obj
+        return async_session() if bind is None else async_session(bind=bind)
 
-    @check_session_param
-    @check_error
-    async def get_all_objs(  # noqa: C901, PLR0912
-        self,
-        db,
-        where: list = [],
-        order_by: list = [],
-        group_by: list = [],
-        join_lst: list = [],
-        aggregate: dict = {},
-        fields: list = [],
-        session=None,
-    ) -> list:
+    def _choose_replica(self) -> int | None:
         """
-        Возвращает все экземпляры переданного класса.
+        Выбор реплики для новой сессии чтения.
 
-        :param db: класс таблицы из которой необходимо получить данные
-        :param where: условия выборки
-        :param order_by: параметры сортировки
-        :param group_by: параметры группировки
-        :param join_lst: список джойнов
-        :param aggregate: словарь с агрегатными функциями
-        :param fields: поля для выборки
-        :param session: сессия работы с БД
+        :return: номер реплики или None, если читать нужно с основной БД
+        """
 
-        :return: список экземпляров
+        if not self.replicas or self._pinned():
+            # Реплика может ещё не получить недавнюю запись
+            return None
+
+        if self.replica_strategy == 'least_loaded':
+            return min(
+                range(len(self.replicas)), key=self.__replica_load.__getitem__
+            )
+
+        return next(self.__replica_counter) % len(self.replicas)
+
+    def _pinned(self) -> bool:
+        """Была ли в текущем контексте запись за последние `read_your_writes` с."""
+
+        last_write = self.__last_write.get()
+
+        return (
+            last_write is not None
+            and time.monotonic() - last_write < self.read_your_writes
+        )
+
+    @contextlib.asynccontextmanager
+    async def session_scope(self):
         """
+        Одна сессия для всех вызовов помощника без сессии внутри блока.
 
-        try:
-            query = select(*fields) if fields else select(db)
-
-            if join_lst:
-                query = query.select_from(db)
-                for data in join_lst:
-                    if data.get('onclause'):
-                        if data.get('type') == 'left':
-                            query = query.outerjoin(data['target'], data['onclause'])
-                        else:
-                            query = query.join(data['target'], data['onclause'])
-                    elif data.get('type') == 'left':
-                        query = query.outerjoin(data['target'])
-                    else:
-                        query = query.join(data['target'])
-
-            if where:
-                query = query.where(*where)
-
-            if group_by:
-                query = query.group_by(*group_by)
-
-            if aggregate:
-                for column, func in aggregate.items():
-                    query = query.add_columns(
-                        func(getattr(db, column)).label(column)
-                    )
+        В отличие от `transaction()` каждый вызов коммитится сам, но сессия и
+        её карта объектов не создаются заново на каждый вызов, а соединение
+        после коммита возвращается в пул. Вложенный вызов использует
+        сессию внешнего блока, внутри `transaction()` - сессию транзакции.
+        Сессию нельзя использовать из параллельных задач.
 
-            if order_by:
-                query = query.order_by(*order_by)
+        :return: сессия области
+        """
 
-            objs = await session.execute(query)
+        shared = self._shared_session()
+        if shared is not None:
+            yield shared
+            return
 
-            result = objs.unique().all() if fields else objs.unique().scalars().all()
-        except Exception:
-            await session.rollback()
-            raise
-        else:
-            msg = f'Возвращён список значений таблицы `{db.__name__}` '
-            if not fields:
-                msg += f'{[x.id for x in result]}'
-            self.log.debug(msg)
-            return result
+        async with self._new_session() as session:
+            token = self.__scope.set(session)
+            try:
+                yield session
+            finally:
+                self.__scope.reset(token)
 
-    # = Create запросы ==============================================================
-    @check_session_param
-    @check_error
-    async def create_obj(self, db, data: dict, session=None):
+    @contextlib.asynccontextmanager
+    async def transaction(self, savepoints: bool = True):
         """
-        Создаёт запрос на создание данных в БД.
+        Транзакция, общая для всех вызовов помощника внутри блока.
 
-        :param db: класс таблицы, в которую необходимо добавить данные
-        :param data: данные объекта
-        :param session: сессия работы с БД
+        Вызовы без сессии используют сессию транзакции, а вместо коммита
+        выполняют `flush`. Коммит выполняется один раз при выходе из блока,
+        откат - при исключении. Вложенный вызов `transaction()` присоединяется к
+        внешней транзакции. Сессию нельзя использовать из параллельных задач.
 
-        :return: объект созданных данных
+        :param savepoints: выполнять каждый вызов в точке сохранения, чтобы
+            ошибка откатывала только его, а не всю транзакцию (на SQLite для
+            этого меняется управление транзакциями подключений движка, см.
+            `_enable_sqlite_savepoints`)
+
+        :return: сессия транзакции
         """
 
-        try:
-            obj = db(**data)  # Создание объекта
-            session.add(obj)
+        transaction = self.__transaction.get()
+        if transaction is not None:
+            yield transaction[0]
+            return
 
-            await session.commit()  # Сохранение объекта в БД
-            await session.refresh(obj)  # Обновление данных в переменной объекта
-        except Exception as exp:
-            await session.rollback()
+        # Отложенные до коммита сбросы кэша объектов
+        invalidations = []
 
-            if str(exp).find('отсутствует в таблице') != -1:
-                msg = re.findall('Ключ .+', str(exp))[0]
-                msg += f' Не удалось создать объект с данными {data}'
-                raise Exception(msg)
+        async with self._open_session(self.async_session) as session:
+            async with session.begin():
+                token = self.__transaction.set((session, savepoints, invalidations))
+                try:
+                    yield session
+                finally:
+                    self.__transaction.reset(token)
 
-            if isinstance(exp, IntegrityError):
-                msg = f'Создаваемый объект с данными `{data}` уже существует!'
-                raise Exception(msg)
+            for db, key in invalidations:
+                await self._drop_cached(db, key)
 
-            raise
-        else:
-            msg = f'Создан новый `{db.__name__}` с данными `{data}`'
-            self.log.debug(msg)
+    def _shared_session(self):
+        """Сессия открытой транзакции или области `session_scope()`."""
 
-            return obj
+        transaction = self.__transaction.get()
+        if transaction is not None:
+            return transaction[0]
 
-    # = Update запросы ==============================================================
-    @check_session_param
-    @check_error
-    async def update_objs(self, db, data: dict, where: list = None, session=None):
+        return self.__scope.get()
+
+    def _in_transaction(self, session) -> bool:
+        """Является ли сессия сессией открытой транзакции."""
+
+        transaction = self.__transaction.get()
+
+        return transaction is not None and transaction[0] is session
+
+    @contextlib.asynccontextmanager
+    async def _savepoint(self, session):
         """
-        Обновляет данные в таблице базы данных.
+        Точка сохранения для вызова внутри транзакции `transaction()`.
 
-        :param db: класс таблицы, в которой необходимо обновить данные
-        :param data: новые данные
-        :param where: условия выборки
         :param session: сессия работы с БД
-
-        :return: Количество обновлённых данных
         """
 
-        where = where if where else []
+        transaction = self.__transaction.get()
+        if not self._in_transaction(session) or not transaction[1]:
+            yield
+            return
 
+        nested = await session.begin_nested()
         try:
-            query = update(db).where(*where).values(**data)
+            yield
+        except BaseException:
+            await self._rollback(session)
+            raise
 
-            result = await session.execute(query)
+        if nested.is_active:
+            await nested.commit()
+        else:
+            # Точка сохранения после ошибки, подавленной `check_error`
+            await self._rollback(session)
+
+    @staticmethod
+    async def _refresh_expired(session, obj) -> None:
+        """Обновление объекта, только если коммит сбросил его атрибуты."""
+
+        if inspect(obj).expired_attributes:
+            await session.refresh(obj)
+
+    async def _commit(self, session) -> None:
+        """Коммит, а внутри транзакции `transaction()` - только `flush`."""
+
+        if self._in_transaction(session):
+            await session.flush()
+        else:
             await session.commit()
 
-            # Получаем количество обновленных строк
-            updated_count = result.rowcount
-        except Exception:
-            msg = f'Не удалось обновить данные для таблицы `{db.__name__}` `{data=}`'
-            self.log.exception(msg)
+        self.__last_write.set(time.monotonic())
+
+    async def _rollback(self, session) -> None:
+        """Откат, а внутри транзакции `transaction()` - откат точки сохранения."""
 
+        if not self._in_transaction(session):
             await session.rollback()
-            raise
-        else:
-            msg = (
-                f'Обновлены данные для таблицы `{db.__name__}`. Новые данные '
-                f'`{data}`'
-            )
-            self.log.debug(msg)
-            return updated_count  # Возвращаем количество обновленных строк
+            return
 
-    @check_session_param
-    @check_error
-    async def create_or_update(self, db, data: dict, where: dict, session=None):
+        nested = session.get_nested_transaction()
+        if nested is not None:
+            await nested.rollback()
+
+    # == Параллельные запросы ======================================================
+    async def gather_queries(
+        self,
+        queries: list,
+        max_concurrency: int = 10,
+        timeout: float | None = None,
+        *,
+        error: bool = True,
+    ) -> list:
         """
-        Создает или обновляет запись в таблице базы данных.
+        Параллельное выполнение независимых запросов помощника.
 
-        :param db: класс таблицы, в которую необходимо добавить или обновить данные
-        :param data: данные объекта
-        :param where: условия выборки
-        :param session: сессия работы с БД
+        Каждый запрос выполняется в отдельной задаче со своей сессией из пула,
+        даже если вызов сделан внутри `transaction()` или `session_scope()`.
+        Запросам нельзя передавать одну и ту же сессию.
 
-        :return: объект созданных или обновленных данных
+        :param queries: вызываемые объекты без аргументов, возвращающие корутину,
+            например `functools.partial(sas.get_obj, User, 1)`
+        :param max_concurrency: максимальное количество одновременных запросов
+        :param timeout: время ожидания всех запросов в секундах, по истечении
+            которого незавершённые запросы отменяются (None - без ограничения)
+        :param error: возвращать ли ошибку запроса или истечения времени;
+            при False вместо результата такого запроса возвращается None
+
+        :raise TimeoutError: истекло время ожидания
+
+        :return: результаты запросов в порядке их передачи
         """
 
+        if not queries:
+            return []
+
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def run(query):
+            """Выполнение запроса в собственной сессии."""
+            async with semaphore:
+                # Контекст задачи - копия, внешние значения не меняются
+                self.__transaction.set(None)
+                self.__scope.set(None)
+
+                return await query()
+
+        tasks = [asyncio.create_task(run(query)) for query in queries]
+
         try:
-            query = select(db).where(*where)
-            result = await session.execute(query)
+            async with asyncio.timeout(timeout):
+                if error:
+                    # Первая ошибка прерывает ожидание остальных запросов
+                    return await asyncio.gather(*tasks)
 
-            instance = result.scalars().first()
+                await asyncio.wait(tasks)
+        except TimeoutError:
+            if error:
+                raise
+        finally:
+            # Отмена незавершённых запросов с ожиданием закрытия их сессий
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        return [
+            None if task.cancelled() or task.exception() else task.result()
+            for task in tasks
+        ]
 
-            if instance:
-                for key, value in data.items():
-                    setattr(instance, key, value)
-                msg = 'Обновлён'
-            else:
-                instance = db(**data)
-                session.add(instance)
-                msg = 'Создан'
+    # == Отложенная запись ==========================================================
+    def write_buffer(
+        self,
+        max_size: int = 1000,
+        flush_interval: float = 1.0,
+        max_pending: int = 10_000,
+    ) -> WriteBuffer:
+        """
+        Создание буфера записи строк пачками, закрываемого в `close()`.
 
-            await session.commit()
+        :param max_size: количество строк, при котором буфер записывается сразу
+        :param flush_interval: максимальное время ожидания записи в секундах
+        :param max_pending: максимальное количество незаписанных строк, при
+            котором добавление строк ждёт освобождения места
 
-        except Exception as exp:
-            await session.rollback()
+        :return: буфер записи
+        """
 
-            if str(exp).find('отсутствует в таблице') != -1:
-                msg = (
-                    f'Не был найден объект `{db}`, с которым необходимо '
-                    f'сделать связь. `{re.findall("Ключ .+", str(exp))[0]}`'
-                )
+        buffer = WriteBuffer(self, max_size, flush_interval, max_pending)
+        self.__buffers.append(buffer)
 
-            if isinstance(exp, IntegrityError):
-                msg = f'Объект `{db}` с данными `{data}` уже существует!'
+        return buffer
 
-            self.log.exception(msg)
+    async def close(self) -> None:
+        """Закрытие буферов записи, отписка от событий движков и закрытие движка."""
 
-            raise
-        else:
-            msg += f' `{db.__name__}` с данными `{data}`'
-            self.log.debug(msg)
+        buffers, self.__buffers = self.__buffers, []
+        for buffer in buffers:
+            await buffer.close()
 
-            return instance
+        self._unlisten_slow_queries()
+        await self.dispose()
+
+    # == Построение запросов ========================================================
+    def _build_select(
+        self,
+        db,
+        where: list = [],
+        order_by: list = [],
+        group_by: list = [],
+        join_lst: list = [],
+        aggregate: dict = {},
+        fields: list = [],
+        shape: str | None = None,
+    ):
+        """
+        Построение запроса выборки с использованием кэша форм запросов.
+
+        Из кэша по названию формы `shape` берётся запрос со всем, кроме условий
+        `where`, которые добавляются при каждом вызове. Без названия формы
+        запрос строится заново: вычисление ключа по самим выражениям обходится
+        дороже построения запроса.
+
+        :param shape: название формы запроса: одинаковые сортировка,
+            группировка, джойны, агрегатные функции и поля (None - не
+            кэшировать)
+
+        :return: запрос выборки
+        """
+
+        if self.query_cache is None or shape is None:
+            return build_select(
+                db, where, order_by, group_by, join_lst, aggregate, fields
+            )
+
+        key = (db, shape)
+        query = self.query_cache.get(key)
+
+        if query is None:
+            query = build_select(
+                db, [], order_by, group_by, join_lst, aggregate, fields
+            )
+            self.query_cache.set(key, query)
+
+        return query.where(*where) if where else query
+
+    # == Кэш объектов ===============================================================
+    async def _invalidate(self, db, obj=None, session=None) -> None:
+        """
+        Удаляет из кэша объектов изменённый объект или все объекты таблицы.
+
+        Внутри `transaction()` изменения ещё не зафиксированы, и другой вызов
+        мог бы снова закэшировать старую строку, поэтому сброс откладывается до
+        коммита транзакции.
+
+        :param db: класс таблицы
+        :param obj: изменённый объект, None - все объекты таблицы
+        :param session: сессия, в которой выполнено изменение
+        """
+
+        if self.obj_cache is None:
+            return
+
+        key = None if obj is None else get_identity(obj)
+
+        if self._in_transaction(session):
+            self.__transaction.get()[2].append((db, key))
+            return
+
+        await self._drop_cached(db, key)
+
+    async def _drop_cached(self, db, key=None) -> None:
+        """
+        Удаление объекта или всех объектов таблицы из кэша объектов.
+
+        :param db: класс таблицы
+        :param key: значение первичного ключа, None - все объекты таблицы
+        """
+
+        self.__table_writes[db] = time.monotonic()
+
+        if key is None:
+            await self.obj_cache.clear(db)
+        else:
+            await self.obj_cache.delete((db, key))
+
+    # == Логирование ================================================================
+    def _debug(self, build_msg) -> None:
+        """
+        Ленивый вывод отладочного сообщения.
+
+        Сообщение строится, только если уровень DEBUG включён в логгере.
+
+        :param build_msg: функция без аргументов, возвращающая сообщение
+        """
+
+        if hasattr(self.log, 'opt'):  # loguru
+            self.log.opt(lazy=True, depth=1).debug('{}', build_msg)
+        elif not hasattr(self.log, 'isEnabledFor') or self.log.isEnabledFor(
+            logging.DEBUG
+        ):
+            self.log.debug(build_msg())
+
+    def _short(self, value) -> str:
+        """Строковое представление данных, ограниченное `log_limit` элементами."""
+
+        return short_repr(value, self.log_limit)
+
+    def _enable_sqlite_savepoints(self) -> None:
+        """
+        Точки сохранения `transaction()` на SQLite.
+
+        Драйвер sqlite3 (и aiosqlite поверх него) не отправляет `BEGIN` перед
+        `SAVEPOINT`, и `RELEASE` первой точки сохранения фиксирует все
+        изменения транзакции. Как рекомендует документация SQLAlchemy, у
+        подключений движка отключается управление транзакциями драйвера, а
+        `BEGIN` отправляется при начале транзакции SQLAlchemy. Подписка
+        выполняется один раз на движок и действует на новые подключения.
+        """
+
+        engine = self.async_session.kw.get('bind')
+        if (
+            engine is None
+            or engine.dialect.name != 'sqlite'
+            or engine.sync_engine in SQLITE_SAVEPOINT_ENGINES
+        ):
+            return
+
+        SQLITE_SAVEPOINT_ENGINES.add(engine.sync_engine)
+        event.listen(engine.sync_engine, 'connect', sqlite_connect)
+        event.listen(engine.sync_engine, 'begin', sqlite_begin)
+
+    def _listen_slow_queries(self) -> None:
+        """
+        Подписка на события движков для вывода медленных запросов в лог.
+
+        Сессии помощника открываются на копии движка с параметром выполнения
+        `sql_assistant`, поэтому каждый запрос учитывается только помощником,
+        который его выполнил. Запросы в переданных сессиях не учитываются.
+        """
+
+        for async_session in [self.async_session, *self.replicas]:
+            engine = async_session.kw.get('bind')
+            if engine is None:
+                continue
+
+            sync_engine = engine.sync_engine
+            if sync_engine not in SLOW_QUERY_ENGINES:
+                SLOW_QUERY_ENGINES.add(sync_engine)
+                event.listen(
+                    sync_engine, 'before_cursor_execute', before_cursor_execute
+                )
+                event.listen(
+                    sync_engine, 'after_cursor_execute', after_cursor_execute
+                )
+
+            # Слабая ссылка не удерживает помощника в памяти
+            self.__slow_query_binds[async_session] = engine.execution_options(
+                sql_assistant=weakref.ref(self)
+            )
+
+    def _unlisten_slow_queries(self) -> None:
+        """Отписка помощника от вывода медленных запросов движков."""
+
+        self.__slow_query_binds.clear()
+
+    def _log_slow_query(self, elapsed: float, statement: str) -> None:
+        """
+        Вывод медленного запроса в лог.
+
+        :param elapsed: время выполнения запроса в секундах
+        :param statement: SQL запроса
+        """
+
+        if elapsed < self.slow_query_threshold:
+            return
+
+        self.log.warning(f'Медленный запрос ({elapsed:.3f} с): {statement}')
+        if self.metrics is not None:
+            self.metrics.record('slow_query', elapsed)
+
+    def _short_ids(self, objs: list) -> str:
+        """Список id объектов, ограниченный `log_limit` элементами."""
+
+        ids = [get_identity(obj) for obj in objs[: self.log_limit]]
+
+        return short_repr(ids, self.log_limit, len(objs))
+
+    # == Обработка ошибок ===========================================================
+    @staticmethod
+    def _raise_create_error(exp, data) -> NoReturn:
+        """
+        Преобразует ошибку создания объекта в понятное сообщение.
+
+        :param exp: возникшая ошибка
+        :param data: данные, с которыми создавался объект
+
+        :raise Exception: ошибка с понятным сообщением
+        """
+
+        if str(exp).find('отсутствует в таблице') != -1:
+            msg = re.findall('Ключ .+', str(exp))[0]
+            msg += f' Не удалось создать объект с данными {data}'
+            raise Exception(msg) from exp
+
+        if isinstance(exp, IntegrityError):
+            msg = f'Создаваемый объект с данными `{data}` уже существует!'
+            raise Exception(msg) from exp
+
+        raise exp
+
+    # == Запросы в БД ===============================================================
+    # = Select запросы ==============================================================
+    @check_retry
+    @check_metrics
+    @check_error
+    async def get_obj(self, db, id_: int, session=None):
+        """
+        Возвращает объект по id.
+
+        Если задан кэш объектов и не передана сессия, объект сначала ищется в
+        кэше, а полученный из БД объект сохраняется в кэш. При `coalesce=True`
+        одновременные вызовы без сессии объединяются в один запрос.
+
+        :param db: класс таблицы, из которой необходимо получить объект
+        :param id_: id объекта
+        :param session: сессия работы с БД
+
+        :raise Exception: программная ошибка
+
+        :return: объект таблицы
+        """
+
+        if session is not None or self._shared_session() is not None:
+            return await self._fetch_obj(db, id_, session=session)
+
+        # После записи в текущем контексте объект читается с основной БД: кэш
+        # мог заполнить другой контекст с отстающей реплики, а общий запрос
+        # `coalesce` выполняется в контексте вызова, начавшего его
+        pinned = bool(self.replicas) and self._pinned()
+
+        if self.obj_cache is not None and not pinned:
+            obj = await self.obj_cache.get((db, id_))
+            if obj is not None:
+                return obj
+
+        if self.batch_loader is None or pinned:
+            obj = await self._fetch_obj(db, id_)
+        else:
+            obj = await self.batch_loader.load(db, id_)
+            if obj is None:
+                msg = f'Объект с id={id_} не найден!'
+                self.log.exception(msg)
+                raise AssertionError(msg)
+
+        if self.obj_cache is not None and self._cacheable(db, pinned):
+            await self.obj_cache.set((db, id_), obj)
+
+        return obj
+
+    def _cacheable(self, db, pinned: bool) -> bool:
+        """
+        Можно ли сохранить в кэш объект, только что прочитанный `get_obj`.
+
+        Объект с реплики не сохраняется в течение `read_your_writes` секунд
+        после записи в таблицу: реплика могла вернуть значение до записи.
+
+        :param db: класс таблицы
+        :param pinned: объект прочитан с основной БД после записи в контексте
+
+        :return: сохранять ли объект в кэш
+        """
+
+        if not self.replicas or pinned:
+            return True
+
+        last_write = self.__table_writes.get(db)
+
+        return (
+            last_write is None
+            or time.monotonic() - last_write >= self.read_your_writes
+        )
+
+    @check_session_param(read=True)
+    async def _fetch_obj(self, db, id_: int, session=None):
+        """
+        Возвращает объект по id из БД.
+
+        :param db: класс таблицы, из которой необходимо получить объект
+        :param id_: id объекта
+        :param session: сессия работы с БД
+
+        :return: объект таблицы
+        """
+
+        try:
+            obj = await session.get(db, id_)
+
+            assert obj, f'Объект с id={id_} не найден!'
+
+        except Exception as exp:
+            msg = str(exp)
+            self.log.exception(msg)
+
+            await self._rollback(session)
+            raise exp
+
+        else:
+            return obj
+
+    @check_retry
+    @check_metrics
+    @check_error
+    async def get_objs_by_ids(
+        self, db, ids: list, *, chunk_size: int = 500, session=None
+    ) -> list:
+        """
+        Возвращает объекты по списку значений первичного ключа.
+
+        Объекты получаются запросами `WHERE pk IN (...)` по `chunk_size`
+        значений, чтобы не превысить ограничение БД на количество параметров.
+
+        :param db: класс таблицы, из которой необходимо получить объекты
+        :param ids: значения ключа (кортежи значений для составного ключа)
+        :param chunk_size: количество значений ключа в одном запросе
+        :param session: сессия работы с БД
+
+        :return: найденные объекты в порядке `ids`
+        """
+
+        # Значения составного ключа должны быть хэшируемыми
+        ids = [tuple(id_) if isinstance(id_, list) else id_ for id_ in ids]
+
+        objs = await self._fetch_objs_by_ids(
+            db, ids, chunk_size=chunk_size, session=session
+        )
+
+        return [objs[id_] for id_ in ids if id_ in objs]
+
+    @check_session_param(read=True)
+    async def _fetch_objs_by_ids(
+        self, db, ids: list, *, chunk_size: int = 500, session=None
+    ) -> dict:
+        """
+        Возвращает объекты по списку значений первичного ключа из БД.
+
+        :param db: класс таблицы, из которой необходимо получить объекты
+        :param ids: значения ключа (кортежи значений для составного ключа)
+        :param chunk_size: количество значений ключа в одном запросе
+        :param session: сессия работы с БД
+
+        :return: словарь {значение ключа: объект}
+        """
+
+        objs = {}
+        ids = list(dict.fromkeys(ids))
+
+        try:
+            for start in range(0, len(ids), chunk_size):
+                query = select(db).where(
+                    identity_condition(db, ids[start : start + chunk_size])
+                )
+                result = await session.execute(query)
+
+                for obj in result.scalars():
+                    objs[get_identity(obj)] = obj
+        except Exception:
+            msg = f'Не удалось получить объекты таблицы `{db.__name__}` по ключам'
+            self.log.exception(msg)
+
+            await self._rollback(session)
+            raise
+        else:
+            self._debug(
+                lambda: f'Возвращено {len(objs)} объектов таблицы `{db.__name__}` '
+                f'по ключам'
+            )
+
+            return objs
+
+    @check_retry
+    @check_metrics
+    @check_session_param(read=True)
+    @check_error
+    async def get_all_objs(
+        self,
+        db,
+        where: list = [],
+        order_by: list = [],
+        group_by: list = [],
+        join_lst: list = [],
+        aggregate: dict = {},
+        fields: list = [],
+        *,
+        readonly: bool = False,
+        load: list | dict = [],
+        shape: str | None = None,
+        session=None,
+    ) -> list:
+        """
+        Возвращает все экземпляры переданного класса.
+
+        :param db: класс таблицы из которой необходимо получить данные
+        :param where: условия выборки
+        :param order_by: параметры сортировки
+        :param group_by: параметры группировки
+        :param join_lst: список джойнов
+        :param aggregate: словарь с агрегатными функциями
+        :param fields: поля для выборки
+        :param readonly: вернуть вместо экземпляров модели строки (`Row`, как
+            именованный кортеж, `row._asdict()` - словарь) со столбцами таблицы,
+            без создания объектов ORM и их отслеживания сессией
+        :param load: связи, загружаемые вместе с экземплярами (опции
+            `selectinload(...)`/`joinedload(...)`, названия связей или словарь
+            `{'связь': стратегия}`)
+        :param shape: название формы запроса для кэша построенных запросов:
+            вызовы с одним названием должны отличаться только условиями `where`
+            (None - не кэшировать)
+        :param session: сессия работы с БД
+
+        :return: список экземпляров
+        """
+
+        if readonly and not fields:
+            fields = list(db.__table__.columns)
+
+        try:
+            query = self._build_select(
+                db, where, order_by, group_by, join_lst, aggregate, fields, shape
+            )
+            if load:
+                query = query.options(*build_load_options(db, load))
+
+            objs = await session.execute(query)
+
+            result = objs.unique().all() if fields else objs.unique().scalars().all()
+        except Exception:
+            await self._rollback(session)
+            raise
+        else:
+            self._debug(
+                lambda: f'Возвращён список значений таблицы `{db.__name__}` '
+                + ('' if fields else self._short_ids(result))
+            )
+            return result
+
+    @check_retry
+    @check_metrics
+    @check_session_param(read=True)
+    @check_error
+    async def execute_spec(
+        self, spec: QuerySpec, params: dict = {}, *, session=None
+    ) -> list:
+        """
+        Выполняет заранее построенный запрос выборки.
+
+        Запрос не строится и не проверяется повторно: на каждый вызов
+        приходятся только проверка параметров и выполнение, а SQL берётся из
+        кэша компиляции SQLAlchemy. Компиляция диалектом проверяется при первом
+        выполнении.
+
+        :param spec: описание запроса `QuerySpec`
+        :param params: значения параметров `bindparam` запроса
+        :param session: сессия работы с БД
+
+        :raise Exception: не переданы обязательные или переданы неизвестные
+            параметры
+
+        :return: список экземпляров или строк, если в запросе заданы `fields`
+        """
+
+        spec.check_params(params)
+
+        try:
+            spec.check_dialect(session.get_bind().dialect)
+            objs = await session.execute(spec.query, params)
+
+            result = (
+                objs.unique().all() if spec.rows else objs.unique().scalars().all()
+            )
+        except Exception:
+            await self._rollback(session)
+            raise
+        else:
+            self._debug(
+                lambda: f'Возвращён список значений таблицы `{spec.db.__name__}` '
+                + ('' if spec.rows else self._short_ids(result))
+            )
+            return result
+
+    async def iter_objs(
+        self,
+        db,
+        where: list = [],
+        order_by: list = [],
+        group_by: list = [],
+        join_lst: list = [],
+        aggregate: dict = {},
+        fields: list = [],
+        *,
+        chunk_size: int = 1000,
+        partitions: bool = False,
+        readonly: bool = False,
+        load: list | dict = [],
+        session=None,
+    ):
+        """
+        Потоково возвращает экземпляры переданного класса.
+
+        Строки читаются через серверный курсор пачками по `chunk_size`, поэтому
+        потребление памяти не зависит от размера таблицы. В отличие от
+        `get_all_objs` дубликаты не убираются (`unique()` несовместим с
+        `yield_per`).
+
+        :param db: класс таблицы из которой необходимо получить данные
+        :param where: условия выборки
+        :param order_by: параметры сортировки
+        :param group_by: параметры группировки
+        :param join_lst: список джойнов
+        :param aggregate: словарь с агрегатными функциями
+        :param fields: поля для выборки
+        :param chunk_size: количество строк, получаемых из БД за раз
+        :param partitions: возвращать пачки строк вместо отдельных строк
+        :param readonly: вернуть вместо экземпляров модели строки (`Row`) со
+            столбцами таблицы, без создания объектов ORM
+        :param load: связи, загружаемые вместе с экземплярами (как в
+            `get_all_objs`, коллекции - только через `selectin`)
+        :param session: сессия работы с БД
+
+        :return: асинхронный генератор экземпляров или пачек экземпляров
+        """
+
+        if readonly and not fields:
+            fields = list(db.__table__.columns)
+
+        query = self._build_select(
+            db, where, order_by, group_by, join_lst, aggregate, fields
+        ).execution_options(yield_per=chunk_size)
+        if load:
+            query = query.options(*build_load_options(db, load))
+
+        count = 0
+        start = time.perf_counter()
+
+        async with self._get_session(session, read=True) as session:
+            try:
+                result = await session.stream(query)
+                if not fields:
+                    result = result.scalars()
+
+                if partitions:
+                    async for partition in result.partitions():
+                        count += len(partition)
+                        yield partition
+                else:
+                    async for obj in result:
+                        count += 1
+                        yield obj
+            except Exception:
+                if self.metrics is not None:
+                    elapsed = time.perf_counter() - start
+                    self.metrics.record('iter_objs', elapsed, count, error=True)
+
+                await self._rollback(session)
+                raise
+
+        if self.metrics is not None:
+            self.metrics.record('iter_objs', time.perf_counter() - start, count)
+
+        self._debug(
+            lambda: f'Потоково возвращено {count} значений таблицы `{db.__name__}`'
+        )
+
+    @check_retry
+    @check_metrics
+    @check_session_param(read=True)
+    @check_error
+    async def paginate(
+        self,
+        db,
+        where: list = [],
+        order_by: list = [],
+        page_size: int = 50,
+        after: str | None = None,
+        join_lst: list = [],
+        load: list | dict = [],
+        session=None,
+    ) -> tuple[list, str | None]:
+        """
+        Возвращает страницу экземпляров с keyset-пагинацией.
+
+        Вместо `OFFSET` следующая страница ищется по значениям столбцов
+        сортировки последней строки, поэтому глубокие страницы получаются так же
+        быстро, как первая. Первичный ключ добавляется в сортировку для
+        однозначности курсора.
+
+        :param db: класс таблицы из которой необходимо получить данные
+        :param where: условия выборки
+        :param order_by: столбцы таблицы `db` для сортировки (допускается
+            `.desc()`), NULL располагаются последними
+        :param page_size: количество экземпляров на странице
+        :param after: токен продолжения, полученный с предыдущей страницы
+        :param join_lst: список джойнов
+        :param load: связи, загружаемые вместе с экземплярами (как в
+            `get_all_objs`)
+        :param session: сессия работы с БД
+
+        :raise Exception: сортировка не по столбцу таблицы `db`
+
+        :return: список экземпляров и токен следующей страницы (None - последняя)
+        """
+
+        order = [split_order(expression) for expression in order_by]
+        for idx, (column, descending) in enumerate(order):
+            # Значения курсора берутся из атрибутов экземпляров `db`
+            try:
+                prop = db.__mapper__.get_property_by_column(column.expression)
+            except (AttributeError, UnmappedColumnError) as exp:
+                msg = f'Сортировка `{column}` не является столбцом `{db.__name__}`!'
+                raise Exception(msg) from exp
+
+            order[idx] = (getattr(db, prop.key), descending)
+
+        # Первичный ключ - последний критерий сортировки
+        descending = order[-1][1] if order else False
+        keys = [column.key for column, _ in order]
+        order += [
+            (getattr(db, column.name), descending)
+            for column in db.__table__.primary_key.columns
+            if column.name not in keys
+        ]
+
+        try:
+            where = list(where)
+            if after:
+                values = decode_cursor(after, [column for column, _ in order])
+                where.append(keyset_condition(order, values))
+
+            query = build_select(
+                db,
+                where,
+                [keyset_order(column, desc) for column, desc in order],
+                join_lst=join_lst,
+            ).limit(page_size + 1)
+            if load:
+                query = query.options(*build_load_options(db, load))
+
+            objs = await session.execute(query)
+
+            result = objs.unique().scalars().all()
+        except Exception:
+            await self._rollback(session)
+            raise
+
+        token = None
+        if len(result) > page_size:
+            result = result[:page_size]
+
+            last = result[-1]
+            primary_keys = get_primary_keys_values(last)
+            token = encode_cursor(
+                [
+                    primary_keys.get(column.key, getattr(last, column.key))
+                    for column, _ in order
+                ]
+            )
+
+        self._debug(
+            lambda: f'Возвращена страница таблицы `{db.__name__}` '
+            f'из {len(result)} строк'
+        )
+
+        return result, token
+
+    # = Агрегатные запросы ==========================================================
+    @check_retry
+    @check_metrics
+    @check_session_param(read=True)
+    @check_error
+    async def count_objs(
+        self, db, where: list = [], join_lst: list = [], session=None
+    ) -> int:
+        """
+        Возвращает количество строк таблицы без их выборки.
+
+        :param db: класс таблицы, строки которой необходимо посчитать
+        :param where: условия выборки
+        :param join_lst: список джойнов (считаются строки результата джойна)
+        :param session: сессия работы с БД
+
+        :return: количество строк
+        """
+
+        query = build_aggregate(db, where, [], join_lst, {'count': func.count()})
+
+        try:
+            count = await session.scalar(query)
+        except Exception:
+            await self._rollback(session)
+            raise
+
+        self._debug(lambda: f'Посчитано {count} строк таблицы `{db.__name__}`')
+
+        return count
+
+    @check_retry
+    @check_metrics
+    @check_session_param(read=True)
+    @check_error
+    async def exists_obj(
+        self, db, where: list = [], join_lst: list = [], session=None
+    ) -> bool:
+        """
+        Проверяет наличие хотя бы одной строки таблицы.
+
+        :param db: класс таблицы, в которой необходимо найти строку
+        :param where: условия выборки
+        :param join_lst: список джойнов
+        :param session: сессия работы с БД
+
+        :return: найдена ли строка
+        """
+
+        query = select(self._build_select(db, where, join_lst=join_lst).exists())
+
+        try:
+            is_exists = await session.scalar(query)
+        except Exception:
+            await self._rollback(session)
+            raise
+
+        self._debug(
+            lambda: f'Проверено наличие строк таблицы `{db.__name__}`: {is_exists}'
+        )
+
+        return is_exists
+
+    @check_retry
+    @check_metrics
+    @check_session_param(read=True)
+    @check_error
+    async def aggregate_objs(
+        self,
+        db,
+        where: list = [],
+        group_by: list = [],
+        metrics: dict = {},
+        join_lst: list = [],
+        having: list = [],
+        order_by: list = [],
+        session=None,
+    ):
+        """
+        Возвращает агрегаты по таблице, вычисленные на стороне БД.
+
+        :param db: класс таблицы, по которой считаются агрегаты
+        :param where: условия выборки
+        :param group_by: параметры группировки, попадающие в результат
+        :param metrics: словарь `{название: выражение}` агрегатных выражений,
+            например `{'total': func.count(), 'max_id': func.max(User.id)}`
+        :param join_lst: список джойнов
+        :param having: условия на сгруппированные строки
+        :param order_by: параметры сортировки групп
+        :param session: сессия работы с БД
+
+        :raise Exception: не переданы ни агрегаты, ни группировка
+
+        :return: без группировки - одна строка (`Row`) с агрегатами, с
+            группировкой - список строк из значений группировки и агрегатов
+        """
+
+        if not metrics and not group_by:
+            msg = 'Не переданы агрегатные выражения `metrics`!'
+            raise Exception(msg)
+
+        query = build_aggregate(
+            db, where, group_by, join_lst, metrics, having, order_by
+        )
+
+        try:
+            rows = await session.execute(query)
+
+            result = rows.all() if group_by else rows.one()
+        except Exception:
+            await self._rollback(session)
+            raise
+
+        self._debug(
+            lambda: f'Посчитаны агрегаты таблицы `{db.__name__}`: '
+            + short_repr(result if group_by else result._asdict(), self.log_limit)
+        )
+
+        return result
+
+    # = Экспорт =====================================================================
+    @check_error
+    async def export_objs(
+        self,
+        db,
+        where: list = [],
+        fields: list = [],
+        fmt: str = 'csv',
+        sink=None,
+        *,
+        order_by: list = [],
+        chunk_size: int = 10_000,
+        copy: bool = False,
+        session=None,
+    ) -> dict:
+        """
+        Потоковая запись строк таблицы в файл без создания объектов ORM.
+
+        Строки читаются пачками по `chunk_size` через `iter_objs` и сразу
+        записываются, поэтому в памяти находится не больше одной пачки.
+
+        :param db: класс таблицы из которой необходимо получить данные
+        :param where: условия выборки
+        :param fields: поля для выборки (по умолчанию - все столбцы таблицы)
+        :param fmt: формат файла: `csv`, `ndjson` или `parquet` (нужен `pyarrow`)
+        :param sink: путь к файлу или открытый файловый объект (двоичный для
+            `parquet` и `copy`)
+        :param order_by: параметры сортировки
+        :param chunk_size: количество строк, получаемых из БД и записываемых за раз
+        :param copy: выгрузить CSV через `COPY ... TO STDOUT` (только PostgreSQL
+            через asyncpg)
+        :param session: сессия работы с БД
+
+        :raise Exception: неизвестный формат или `copy` не для CSV
+
+        :return: количество строк `rows`, время `elapsed` в секундах и скорость
+            `rows_per_sec`
+        """
+
+        if fmt not in WRITERS:
+            msg = f'Формат `{fmt}` не поддерживается!'
+            raise Exception(msg)
+
+        if copy and fmt != 'csv':
+            msg = '`COPY` поддерживает только формат `csv`!'
+            raise Exception(msg)
+
+        fields = fields or list(db.__table__.columns)
+        count = 0
+        start = time.perf_counter()
+
+        try:
+            if copy:
+                count = await self._copy_objs(
+                    db, where, fields, order_by, sink, session=session
+                )
+            else:
+                writer_class = WRITERS[fmt]
+                with open_sink(sink, writer_class.binary) as file:
+                    writer = writer_class(
+                        file,
+                        [field.key for field in fields],
+                        [field.type for field in fields],
+                    )
+
+                    partitions = self.iter_objs(
+                        db,
+                        where,
+                        order_by,
+                        fields=fields,
+                        chunk_size=chunk_size,
+                        partitions=True,
+                        session=session,
+                    )
+                    async for rows in partitions:
+                        writer.write(rows)
+                        count += len(rows)
+
+                    writer.close()
+        except Exception:
+            if self.metrics is not None:
+                elapsed = time.perf_counter() - start
+                self.metrics.record('export_objs', elapsed, count, error=True)
+            raise
+
+        elapsed = time.perf_counter() - start
+        if self.metrics is not None:
+            self.metrics.record('export_objs', elapsed, count)
+
+        stats = {
+            'rows': count,
+            'elapsed': elapsed,
+            'rows_per_sec': count / elapsed if elapsed else 0.0,
+        }
+
+        self._debug(
+            lambda: f'Выгружено {count} строк таблицы `{db.__name__}` в {fmt} '
+            f'({stats["rows_per_sec"]:.0f} строк/с)'
+        )
+
+        return stats
+
+    @check_session_param(read=True)
+    async def _copy_objs(
+        self, db, where: list, fields: list, order_by: list, sink, session=None
+    ) -> int:
+        """
+        Выгрузка строк в CSV через `COPY (SELECT ...) TO STDOUT`.
+
+        :raise Exception: БД подключена не через asyncpg
+
+        :return: количество выгруженных строк
+        """
+
+        dialect = session.get_bind().dialect
+        if dialect.driver != 'asyncpg':
+            msg = f'`COPY` не поддерживается драйвером `{dialect.driver}`!'
+            raise Exception(msg)
+
+        query = self._build_select(db, where, order_by, fields=fields)
+        sql, params = compile_positional(query, dialect)
+
+        connection = await session.connection()
+        raw_connection = await connection.get_raw_connection()
+
+        with open_sink(sink, binary=True) as file:
+            # Статус вида `COPY 123`
+            status = await raw_connection.driver_connection.copy_from_query(
+                sql, *params, output=file, format='csv', header=True
+            )
+
+        return int(status.split()[-1])
+
+    # = Create запросы ==============================================================
+    @check_retry(write=True)
+    @check_metrics
+    @check_session_param
+    @check_error
+    async def create_obj(
+        self, db, data: dict, *, returning: bool = False, session=None
+    ):
+        """
+        Создаёт запрос на создание данных в БД.
+
+        :param db: класс таблицы, в которую необходимо добавить данные
+        :param data: данные объекта
+        :param returning: получить значения, заданные БД (`id`, значения по
+            умолчанию), через `INSERT ... RETURNING` вместо отдельного `SELECT`
+        :param session: сессия работы с БД
+
+        :return: объект созданных данных
+        """
+
+        try:
+            if returning:
+                obj = await session.scalar(insert_returning(db), [data])
+
+                await self._commit(session)
+                await self._refresh_expired(session, obj)
+            else:
+                obj = db(**data)  # Создание объекта
+                session.add(obj)
+
+                await self._commit(session)  # Сохранение объекта в БД
+                await session.refresh(obj)  # Обновление данных в переменной объекта
+        except Exception as exp:
+            await self._rollback(session)
+            self._raise_create_error(exp, data)
+        else:
+            await self._invalidate(db, obj, session)
+
+            self._debug(
+                lambda: f'Создан новый `{db.__name__}` с данными '
+                f'`{self._short(data)}`'
+            )
+
+            return obj
+
+    @check_retry(write=True)
+    @check_metrics
+    @check_session_param
+    @check_error
+    async def create_objs(
+        self,
+        db,
+        rows: list[dict],
+        *,
+        batch_size: int = 1000,
+        return_objects: bool = False,
+        session=None,
+    ):
+        """
+        Создаёт пачку объектов в БД за одну транзакцию.
+
+        Данные отправляются через `insert()` пачками по `batch_size` строк
+        (executemany), коммит выполняется один раз после всех пачек.
+
+        :param db: класс таблицы, в которую необходимо добавить данные
+        :param rows: список данных объектов, ключи у всех строк должны совпадать
+        :param batch_size: количество строк в одной пачке
+        :param return_objects: возвращать ли созданные объекты (через `RETURNING`)
+        :param session: сессия работы с БД
+
+        :return: количество созданных строк или список созданных объектов
+        """
+
+        objs = []
+        created_count = 0
+        start = 0
+        batch = []
+
+        try:
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start : start + batch_size]
+
+                if return_objects:
+                    result = await session.scalars(insert(db).returning(db), batch)
+                    objs.extend(result.all())
+                else:
+                    await session.execute(insert(db), batch)
+
+                created_count += len(batch)
+
+            await self._commit(session)
+        except Exception as exp:
+            await self._rollback(session)
+            # Пачка может содержать тысячи строк, в сообщение попадает её начало
+            self._raise_create_error(
+                exp,
+                f'{self._short(batch)} (пачка строк с {start} по '
+                f'{start + len(batch) - 1})',
+            )
+        else:
+            self._debug(lambda: f'Создано {created_count} объектов `{db.__name__}`')
+
+            return objs if return_objects else created_count
+
+    @check_retry(write=True)
+    @check_metrics
+    @check_session_param
+    @check_error
+    async def reserve_ids(self, db, count: int, session=None) -> list[int]:
+        """
+        Резервирует значения последовательности первичного ключа таблицы.
+
+        Зарезервированные id можно заранее проставить связанным объектам и
+        создать родителей и потомков пачками `create_objs` без `flush` на
+        каждого родителя. Значения последовательности не возвращаются при
+        откате. Только для PostgreSQL.
+
+        :param db: класс таблицы с одним целочисленным первичным ключом
+        :param count: количество значений
+        :param session: сессия работы с БД
+
+        :raise Exception: диалект БД не поддерживает последовательности
+
+        :return: список зарезервированных id
+        """
+
+        dialect = session.get_bind().dialect
+        if dialect.name != 'postgresql':
+            msg = f'Диалект `{dialect.name}` не поддерживает последовательности!'
+            raise Exception(msg)
+
+        table_name = dialect.identifier_preparer.format_table(db.__table__)
+
+        try:
+            result = await session.scalars(build_reserve_ids(db, table_name, count))
+            ids = result.all()
+        except Exception:
+            await self._rollback(session)
+            raise
+
+        self._debug(
+            lambda: f'Зарезервированы id `{db.__name__}`: '
+            + short_repr(ids, self.log_limit)
+        )
+
+        return ids
+
+    # = Массовая загрузка ===========================================================
+    @check_error
+    async def load_objs(
+        self,
+        db,
+        source,
+        *,
+        conflict_keys: list[str] | None = None,
+        update_fields: list[str] | None = None,
+        chunk_size: int = 10_000,
+        session=None,
+    ) -> dict:
+        """
+        Массовая загрузка строк в таблицу.
+
+        На PostgreSQL через asyncpg строки передаются пачками по `chunk_size`
+        через `COPY ... FROM STDIN` (`copy_records_to_table`) с одним коммитом в
+        конце. При `conflict_keys` строки сначала загружаются во временную
+        таблицу, а затем переносятся в целевую через `INSERT ... ON CONFLICT`.
+        На остальных БД пачки создаются через `create_objs` или `upsert_objs`,
+        каждая пачка - отдельный коммит.
+
+        :param db: класс таблицы, в которую необходимо загрузить данные
+        :param source: путь к файлу CSV (с заголовком) или NDJSON, значения
+            которого преобразуются к типам столбцов, либо итерируемый или
+            асинхронно итерируемый объект словарей; ключи у всех строк должны
+            совпадать
+        :param conflict_keys: поля уникального ключа, по которым ищется
+            конфликт (None - только создание строк)
+        :param update_fields: поля, обновляемые при конфликте (по умолчанию все
+            поля строки, кроме `conflict_keys`; пустой список - не обновлять)
+        :param chunk_size: количество строк в одной пачке
+        :param session: сессия работы с БД
+
+        :return: количество загруженных (при `conflict_keys` - созданных или
+            обновлённых) строк `rows`, время `elapsed` в секундах и скорость
+            `rows_per_sec`
+        """
+
+        count = 0
+        start = time.perf_counter()
+
+        try:
+            count = await self._load_chunks(
+                db, source, conflict_keys, update_fields, chunk_size, session=session
+            )
+        except Exception:
+            if self.metrics is not None:
+                elapsed = time.perf_counter() - start
+                self.metrics.record('load_objs', elapsed, count, error=True)
+            raise
+
+        elapsed = time.perf_counter() - start
+        if self.metrics is not None:
+            self.metrics.record('load_objs', elapsed, count)
+
+        stats = {
+            'rows': count,
+            'elapsed': elapsed,
+            'rows_per_sec': count / elapsed if elapsed else 0.0,
+        }
+
+        self._debug(
+            lambda: f'Загружено {count} строк в таблицу `{db.__name__}` '
+            f'({stats["rows_per_sec"]:.0f} строк/с)'
+        )
+
+        return stats
+
+    @check_session_param
+    async def _load_chunks(
+        self,
+        db,
+        source,
+        conflict_keys: list[str] | None,
+        update_fields: list[str] | None,
+        chunk_size: int,
+        session=None,
+    ) -> int:
+        """
+        Загрузка пачек строк источника через `COPY` или пакетные запросы.
+
+        :return: количество загруженных строк
+        """
+
+        chunks = iter_chunks(source, chunk_size, db)
+
+        if session.get_bind().dialect.driver != 'asyncpg':
+            count = 0
+            async for rows in chunks:
+                if conflict_keys:
+                    count += await self.upsert_objs(
+                        db, rows, conflict_keys, update_fields, session=session
+                    )
+                else:
+                    count += await self.create_objs(db, rows, session=session)
+
+            return count
+
+        try:
+            count = await self._copy_chunks(
+                db, chunks, conflict_keys, update_fields, session
+            )
+            await self._commit(session)
+        except Exception:
+            msg = f'Не удалось загрузить данные в таблицу `{db.__name__}`'
+            self.log.exception(msg)
+
+            await self._rollback(session)
+            raise
+
+        if conflict_keys:
+            await self._invalidate(db, session=session)
+
+        return count
+
+    @staticmethod
+    async def _copy_chunks(db, chunks, conflict_keys, update_fields, session) -> int:
+        """
+        Передача пачек строк через `copy_records_to_table` asyncpg.
+
+        `COPY` не применяет значения по умолчанию, заданные в модели, поэтому
+        при их отсутствии в строках, как и при `conflict_keys`, строки
+        загружаются во временную таблицу и переносятся в целевую запросом.
+
+        :return: количество загруженных строк, при `conflict_keys` - созданных
+            или обновлённых при переносе из временной таблицы
+        """
+
+        db_table = db.__table__
+        connection = await session.connection()
+        raw_connection = await connection.get_raw_connection()
+        # Адаптер asyncpg открывает транзакцию при первом запросе через него,
+        # а `COPY` идёт мимо адаптера и без этого фиксировался бы сразу
+        await connection.exec_driver_sql('SELECT 1')
+        preparer = connection.dialect.identifier_preparer
+
+        table_name, schema_name = db_table.name, db_table.schema
+        keys = columns = None
+        staging = False
+        count = 0
+
+        async for rows in chunks:
+            if keys is None:
+                keys = list(rows[0])
+                columns = [db_table.c[key].name for key in keys]
+                staging = bool(conflict_keys) or any(
+                    table_column.default is not None and table_column.key not in keys
+                    for table_column in db_table.columns
+                )
+
+                if staging:
+                    # Временная таблица только с типами загружаемых столбцов,
+                    # без ограничений, удаляется при коммите или откате
+                    table_name = f'sql_assistant_load_{uuid.uuid4().hex[:12]}'
+                    schema_name = None
+                    await connection.exec_driver_sql(
+                        f'CREATE TEMP TABLE {preparer.quote(table_name)} '
+                        f'ON COMMIT DROP AS SELECT '
+                        f'{", ".join(map(preparer.quote, columns))} '
+                        f'FROM {preparer.format_table(db_table)} WITH NO DATA'
+                    )
+
+            await raw_connection.driver_connection.copy_records_to_table(
+                table_name,
+                records=[tuple(row.get(key) for key in keys) for row in rows],
+                columns=columns,
+                schema_name=schema_name,
+            )
+            count += len(rows)
+
+        if staging:
+            insert_dialect = importlib.import_module(
+                UPSERT_DIALECTS['postgresql']
+            ).insert
+            query = build_merge(
+                insert_dialect,
+                db,
+                table_name,
+                columns,
+                conflict_keys or None,
+                update_fields,
+            )
+            result = await session.execute(query)
+            count = result.rowcount
+
+        return count
+
+    # = Update запросы ==============================================================
+    @check_retry(write=True)
+    @check_metrics
+    @check_session_param
+    @check_error
+    async def update_objs(self, db, data: dict, where: list = None, session=None):
+        """
+        Обновляет данные в таблице базы данных.
+
+        :param db: класс таблицы, в которой необходимо обновить данные
+        :param data: новые данные
+        :param where: условия выборки
+        :param session: сессия работы с БД
+
+        :return: Количество обновлённых данных
+        """
+
+        where = where if where else []
+
+        try:
+            query = update(db).where(*where).values(**data)
+
+            result = await session.execute(query)
+            await self._commit(session)
+
+            # Получаем количество обновленных строк
+            updated_count = result.rowcount
+        except Exception:
+            msg = f'Не удалось обновить данные для таблицы `{db.__name__}` `{data=}`'
+            self.log.exception(msg)
+
+            await self._rollback(session)
+            raise
+        else:
+            await self._invalidate(db, session=session)
+
+            self._debug(
+                lambda: f'Обновлены данные для таблицы `{db.__name__}`. Новые '
+                f'данные `{self._short(data)}`'
+            )
+            return updated_count  # Возвращаем количество обновленных строк
+
+    @check_retry(write=True)
+    @check_metrics
+    @check_session_param
+    @check_error
+    async def bulk_update_objs(
+        self, db, rows: list[dict], *, batch_size: int = 1000, session=None
+    ) -> int:
+        """
+        Обновляет строки с разными данными, находя их по первичному ключу.
+
+        На PostgreSQL каждая группа строк с одинаковым набором полей
+        отправляется одним `UPDATE ... FROM (VALUES ...)`: asyncpg не
+        возвращает количество строк для executemany. На остальных СУБД
+        используется executemany `UPDATE ... WHERE pk = :pk`, если драйвер
+        считает строки для него, иначе строки обновляются по одной.
+
+        Строки отправляются пачками по `batch_size`, каждая пачка - отдельная
+        транзакция. Кеш таблицы сбрасывается после каждой зафиксированной
+        пачки, в том числе если следующая пачка завершилась ошибкой.
+
+        :param db: класс таблицы, в которой необходимо обновить данные
+        :param rows: список данных строк, включая значения первичного ключа
+        :param batch_size: количество строк в одной транзакции
+        :param session: сессия работы с БД
+
+        :return: Количество обновлённых данных
+        """
+
+        dialect = session.get_bind().dialect
+        updated_count = 0
+
+        try:
+            for start in range(0, len(rows), batch_size):
+                # Строки с разным набором полей требуют разных запросов
+                groups = {}
+                for row in rows[start : start + batch_size]:
+                    groups.setdefault(tuple(row), []).append(row)
+
+                for fields, group in groups.items():
+                    updated_count += await self._bulk_update_group(
+                        db, fields, group, dialect, session
+                    )
+
+                await self._commit(session)
+                await self._invalidate(db, session=session)
+        except Exception:
+            msg = (
+                f'Не удалось обновить данные для таблицы `{db.__name__}`, '
+                f'обновлено {updated_count} строк'
+            )
+            self.log.exception(msg)
+
+            await self._rollback(session)
+            raise
+        else:
+            self._debug(
+                lambda: f'Обновлены данные для таблицы `{db.__name__}`. '
+                f'Обновлено {updated_count} строк'
+            )
+            return updated_count
+
+    @staticmethod
+    async def _bulk_update_group(db, fields, group, dialect, session) -> int:
+        """
+        Обновляет строки с одинаковым набором полей.
+
+        :param db: класс таблицы, в которой необходимо обновить данные
+        :param fields: поля строк
+        :param group: список данных строк
+        :param dialect: диалект БД сессии
+        :param session: сессия работы с БД
+
+        :return: Количество обновлённых данных
+        """
+
+        updated_count = 0
+
+        if dialect.name == 'postgresql':
+            # Число параметров одного запроса ограничено протоколом
+            chunk_size = max(1, MAX_BIND_PARAMS // len(fields))
+            for start in range(0, len(group), chunk_size):
+                query = build_bulk_update_from_values(
+                    db, fields, group[start : start + chunk_size]
+                )
+                result = await session.execute(query)
+                updated_count += result.rowcount
+
+            return updated_count
+
+        query, make_params = build_bulk_update(db, fields)
+
+        if dialect.supports_sane_multi_rowcount:
+            result = await session.execute(
+                query, [make_params(row) for row in group]
+            )
+            return result.rowcount
+
+        for row in group:
+            result = await session.execute(query, make_params(row))
+            updated_count += result.rowcount
+
+        return updated_count
+
+    @check_retry(write=True)
+    @check_metrics
+    @check_session_param
+    @check_error
+    async def create_or_update(
+        self, db, data: dict, where: dict, *, returning: bool = False, session=None
+    ):
+        """
+        Создает или обновляет запись в таблице базы данных.
+
+        :param db: класс таблицы, в которую необходимо добавить или обновить данные
+        :param data: данные объекта
+        :param where: условия выборки
+        :param returning: обновить строку через `UPDATE ... RETURNING`, а если
+            она не найдена - создать через `INSERT ... RETURNING`, без
+            предварительного `SELECT`. Обновляются все строки по условиям,
+            поэтому они должны определять одну строку
+        :param session: сессия работы с БД
+
+        :return: объект созданных или обновленных данных
+        """
+
+        try:
+            if returning:
+                query = update(db).where(*where).values(**data).returning(db)
+                instance = (await session.scalars(query)).first()
+                msg = 'Обновлён'
+
+                if instance is None:
+                    instance = await session.scalar(insert_returning(db), [data])
+                    msg = 'Создан'
+            else:
+                query = select(db).where(*where)
+                result = await session.execute(query)
+
+                instance = result.scalars().first()
+
+                if instance:
+                    for key, value in data.items():
+                        setattr(instance, key, value)
+                    msg = 'Обновлён'
+                else:
+                    instance = db(**data)
+                    session.add(instance)
+                    msg = 'Создан'
+
+            await self._commit(session)
+
+            if returning:
+                await self._refresh_expired(session, instance)
+
+        except Exception as exp:
+            await self._rollback(session)
+
+            if str(exp).find('отсутствует в таблице') != -1:
+                msg = (
+                    f'Не был найден объект `{db}`, с которым необходимо '
+                    f'сделать связь. `{re.findall("Ключ .+", str(exp))[0]}`'
+                )
+
+            if isinstance(exp, IntegrityError):
+                msg = f'Объект `{db}` с данными `{data}` уже существует!'
+
+            self.log.exception(msg)
+
+            raise
+        else:
+            await self._invalidate(db, instance, session)
+
+            self._debug(
+                lambda: f'{msg} `{db.__name__}` с данными `{self._short(data)}`'
+            )
+
+            return instance
+
+    @check_retry(write=True)
+    @check_metrics
+    @check_session_param
+    @check_error
+    async def upsert_objs(
+        self,
+        db,
+        rows: list[dict],
+        conflict_keys: list[str],
+        update_fields: list[str] | None = None,
+        *,
+        batch_size: int = 1000,
+        session=None,
+    ) -> int:
+        """
+        Создаёт или обновляет записи одним запросом `INSERT ... ON CONFLICT`.
+
+        Каждая пачка из `batch_size` строк отправляется одним запросом, коммит
+        выполняется один раз после всех пачек. Пачка уменьшается, чтобы
+        количество параметров не превысило `MAX_BIND_PARAMS`. Из строк с
+        одинаковыми значениями `conflict_keys` записывается последняя.
+
+        :param db: класс таблицы, в которую необходимо добавить или обновить данные
+        :param rows: список данных объектов, ключи у всех строк должны совпадать
+        :param conflict_keys: поля уникального ключа, по которым ищется конфликт
+        :param update_fields: поля, обновляемые при конфликте (по умолчанию все
+            поля строки, кроме `conflict_keys`; пустой список - не обновлять)
+        :param batch_size: количество строк в одной пачке
+        :param session: сессия работы с БД
+
+        :raise Exception: диалект БД не поддерживает `ON CONFLICT`
+
+        :return: количество созданных или обновлённых строк
+        """
+
+        if not rows:
+            return 0
+
+        dialect = session.get_bind().dialect.name
+        if dialect not in UPSERT_DIALECTS:
+            msg = f'Диалект `{dialect}` не поддерживает `ON CONFLICT`!'
+            raise Exception(msg)
+
+        insert_dialect = importlib.import_module(UPSERT_DIALECTS[dialect]).insert
+
+        if update_fields is None:
+            update_fields = [key for key in rows[0] if key not in conflict_keys]
+
+        rows = dedupe_rows(rows, conflict_keys)
+        batch_size = max(1, min(batch_size, MAX_BIND_PARAMS // len(rows[0])))
+
+        upserted_count = 0
+
+        try:
+            for start in range(0, len(rows), batch_size):
+                query = insert_dialect(db).values(rows[start : start + batch_size])
+
+                if update_fields:
+                    query = query.on_conflict_do_update(
+                        index_elements=conflict_keys,
+                        set_={key: query.excluded[key] for key in update_fields},
+                    )
+                else:
+                    query = query.on_conflict_do_nothing(
+                        index_elements=conflict_keys
+                    )
+
+                result = await session.execute(query)
+                upserted_count += result.rowcount
+
+            await self._commit(session)
+        except Exception:
+            msg = f'Не удалось создать или обновить данные таблицы `{db.__name__}`'
+            self.log.exception(msg)
+
+            await self._rollback(session)
+            raise
+        else:
+            await self._invalidate(db, session=session)
+
+            self._debug(
+                lambda: f'Создано или обновлено {upserted_count} объектов '
+                f'`{db.__name__}`'
+            )
+
+            return upserted_count
@@ -0,0 +1,143 @@
+"""Сбор статистики выполнения запросов."""
+
+import bisect
+import math
+
+# Верхние границы интервалов гистограммы времени выполнения в секундах
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, math.inf)
+
+
+def count_rows(result) -> int:
+    """
+    Количество строк, возвращённых или затронутых методом помощника.
+
+    :param result: результат метода
+
+    :return: количество строк
+    """
+
+    if result is None:
+        return 0
+
+    if isinstance(result, bool):
+        return int(result)
+
+    if isinstance(result, int):
+        return result
+
+    if isinstance(result, tuple) and result and isinstance(result[0], list):
+        return len(result[0])  # Страница `paginate`
+
+    if isinstance(result, list | dict):
+        return len(result)
+
+    return 1
+
+
+class MethodStats:
+    """Статистика одного метода помощника."""
+
+    def __init__(self) -> None:
+        """Инициализация пустой статистики."""
+
+        self.count = 0
+        self.errors = 0
+        self.retries = 0
+        self.rows = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.buckets = [0] * len(BUCKETS)
+
+    def add(self, elapsed: float, rows: int, error: bool) -> None:
+        """Добавление одного вызова."""
+
+        self.count += 1
+        self.errors += error
+        self.rows += rows
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+        self.buckets[bisect.bisect_left(BUCKETS, elapsed)] += 1
+
+    def as_dict(self) -> dict:
+        """Статистика в виде словаря."""
+
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'retries': self.retries,
+            'rows': self.rows,
+            'total_time': self.total_time,
+            'avg_time': self.total_time / self.count if self.count else 0.0,
+            'max_time': self.max_time,
+            'histogram': dict(zip(BUCKETS, self.buckets, strict=True)),
+        }
+
+
+class StatsRegistry:
+    """
+    Хранилище статистики вызовов методов помощника в памяти.
+
+    Каждая запись дополнительно передаётся в `callback`, чтобы отправлять
+    метрики во внешнюю систему мониторинга.
+    """
+
+    def __init__(self, callback=None) -> None:
+        """
+        Инициализация хранилища.
+
+        :param callback: функция `(name, elapsed, rows, error)`, вызываемая при
+            каждой записи (`name` - название метода, `session` для открытия
+            сессии, `slow_query` для медленного запроса или `<метод>.retry`
+            для повтора метода с задержкой `elapsed`)
+        """
+
+        self.callback = callback
+        self.__stats = {}
+
+    def record(
+        self, name: str, elapsed: float, rows: int = 0, error: bool = False
+    ) -> None:
+        """
+        Запись одного вызова.
+
+        :param name: название метода или события
+        :param elapsed: время выполнения в секундах
+        :param rows: количество возвращённых или затронутых строк
+        :param error: завершился ли вызов ошибкой
+        """
+
+        stats = self.__stats.get(name)
+        if stats is None:
+            stats = self.__stats[name] = MethodStats()
+
+        stats.add(elapsed, rows, error)
+
+        if self.callback is not None:
+            self.callback(name, elapsed, rows, error)
+
+    def record_retry(self, name: str, delay: float) -> None:
+        """
+        Запись повтора метода после временной ошибки.
+
+        :param name: название метода
+        :param delay: задержка перед повтором в секундах
+        """
+
+        stats = self.__stats.get(name)
+        if stats is None:
+            stats = self.__stats[name] = MethodStats()
+
+        stats.retries += 1
+
+        if self.callback is not None:
+            self.callback(f'{name}.retry', delay, 0, True)
+
+    def snapshot(self) -> dict:
+        """Статистика всех методов в виде словаря."""
+
+        return {name: stats.as_dict() for name, stats in self.__stats.items()}
+
+    def reset(self) -> None:
+        """Очистка статистики."""
+
+        self.__stats.clear()
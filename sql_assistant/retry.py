@@ -0,0 +1,139 @@
+"""Повтор запросов при временных ошибках БД."""
+
+import random
+
+from sqlalchemy.exc import DBAPIError
+
+# SQLSTATE ошибок сериализации и взаимной блокировки: транзакция откачена
+# сервером целиком, поэтому её можно повторить, в том числе с записью
+CONFLICT_SQLSTATES = {'40001', '40P01'}
+# SQLSTATE потери подключения: класс `08` и остановка сервера
+CONNECTION_SQLSTATES = {'57P01', '57P02', '57P03'}
+CONNECTION_SQLSTATE_CLASS = '08'
+
+
+def get_sqlstate(exp: BaseException) -> str | None:
+    """
+    SQLSTATE ошибки драйвера (asyncpg, psycopg).
+
+    :param exp: ошибка, в том числе обёрнутая SQLAlchemy
+
+    :return: код SQLSTATE или None
+    """
+
+    for error in (exp, getattr(exp, 'orig', None)):
+        sqlstate = getattr(error, 'sqlstate', None) or getattr(error, 'pgcode', None)
+        if sqlstate:
+            return str(sqlstate)
+
+    return None
+
+
+def classify_error(exp: BaseException) -> str | None:
+    """
+    Тип временной ошибки БД.
+
+    Проверяется сама ошибка и цепочка `raise ... from` причин.
+
+    :param exp: возникшая ошибка
+
+    :return: `conflict` - сериализация или взаимная блокировка, `connection` -
+        потеря подключения, None - ошибка не временная
+    """
+
+    error = exp
+    while error is not None:
+        sqlstate = get_sqlstate(error)
+        if sqlstate in CONFLICT_SQLSTATES:
+            return 'conflict'
+
+        if (
+            sqlstate in CONNECTION_SQLSTATES
+            or (sqlstate or '').startswith(CONNECTION_SQLSTATE_CLASS)
+            or (isinstance(error, DBAPIError) and error.connection_invalidated)
+            or isinstance(error, ConnectionError)
+        ):
+            return 'connection'
+
+        error = error.__cause__
+
+    return None
+
+
+class RetryPolicy:
+    """
+    Правила повтора метода при временных ошибках БД.
+
+    Задержка перед повтором выбирается случайно от 0 до
+    `min(max_delay, base_delay * multiplier ** номер повтора)`, чтобы
+    столкнувшиеся транзакции не повторялись одновременно.
+    """
+
+    def __init__(
+        self,
+        attempts: int = 3,
+        base_delay: float = 0.05,
+        max_delay: float = 2.0,
+        multiplier: float = 2.0,
+    ) -> None:
+        """
+        Инициализация правил.
+
+        :param attempts: максимальное количество попыток, включая первую
+        :param base_delay: верхняя граница задержки перед первым повтором в
+            секундах
+        :param max_delay: максимальная задержка в секундах
+        :param multiplier: множитель роста верхней границы задержки
+
+        :raise Exception: количество попыток меньше 1
+        """
+
+        if attempts < 1:
+            msg = f'Количество попыток должно быть не меньше 1, передано {attempts}!'
+            raise Exception(msg)
+
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+
+    def should_retry(self, exp: BaseException, attempt: int, *, write: bool) -> bool:
+        """
+        Нужно ли повторить метод после ошибки.
+
+        Методы записи повторяются только после ошибок сериализации и взаимной
+        блокировки: при потере подключения неизвестно, была ли запись
+        зафиксирована.
+
+        :param exp: возникшая ошибка
+        :param attempt: номер завершившейся попытки, начиная с 1
+        :param write: метод изменяет данные
+
+        :return: повторять ли метод
+        """
+
+        if attempt >= self.attempts:
+            return False
+
+        kind = classify_error(exp)
+
+        return kind == 'conflict' if write else kind is not None
+
+    def delay(self, attempt: int) -> float:
+        """
+        Задержка перед повтором.
+
+        :param attempt: номер завершившейся попытки, начиная с 1
+
+        :return: задержка в секундах
+        """
+
+        limit = self.base_delay * self.multiplier ** (attempt - 1)
+
+        return random.uniform(0, min(self.max_delay, limit))
+
+    def __repr__(self) -> str:
+        return (
+            f'RetryPolicy(attempts={self.attempts}, base_delay={self.base_delay}, '
+            f'max_delay={self.max_delay}, multiplier={self.multiplier})'
+        )
@@ -0,0 +1,159 @@
+"""Заранее построенные запросы выборки."""
+
+from sqlalchemy.sql import visitors
+from sqlalchemy.sql.elements import BindParameter
+
+from sql_assistant.handler import build_load_options, build_select
+
+# Допустимые ключи описания джойна и его типы
+JOIN_KEYS = {'target', 'onclause', 'type'}
+JOIN_TYPES = {None, 'inner', 'left'}
+
+
+def validate_join_lst(join_lst: list) -> None:
+    """
+    Проверка описаний джойнов.
+
+    :param join_lst: список джойнов
+
+    :raise Exception: не передана цель, неизвестный ключ или тип джойна
+    """
+
+    for data in join_lst:
+        if not isinstance(data, dict) or data.get('target') is None:
+            msg = f'Не передана цель `target` джойна `{data}`!'
+            raise Exception(msg)
+
+        unknown = set(data) - JOIN_KEYS
+        if unknown:
+            msg = f'Неизвестные ключи джойна `{sorted(unknown)}`!'
+            raise Exception(msg)
+
+        if data.get('type') not in JOIN_TYPES:
+            msg = f'Неизвестный тип джойна `{data["type"]}`!'
+            raise Exception(msg)
+
+
+def validate_aggregate(db, aggregate: dict) -> None:
+    """
+    Проверка агрегатных функций.
+
+    :param db: класс таблицы
+    :param aggregate: словарь `{столбец: агрегатная функция}`
+
+    :raise Exception: столбца нет в таблице или функция не вызываемая
+    """
+
+    for column, func in aggregate.items():
+        if column not in db.__table__.columns:
+            msg = f'Столбца `{column}` нет в таблице `{db.__name__}`!'
+            raise Exception(msg)
+
+        if not callable(func):
+            msg = f'Агрегатная функция столбца `{column}` не вызываемая!'
+            raise Exception(msg)
+
+
+class QuerySpec:
+    """
+    Запрос выборки, построенный и проверенный один раз.
+
+    Описание создаётся при импорте модуля, а выполняется через
+    `SqlAssistant.execute_spec` с параметрами `bindparam(...)` из условий.
+    Повторное выполнение одного и того же объекта запроса использует
+    кэш компиляции SQLAlchemy без построения и разбора описания.
+    """
+
+    def __init__(
+        self,
+        db,
+        where: list = [],
+        order_by: list = [],
+        group_by: list = [],
+        join_lst: list = [],
+        aggregate: dict = {},
+        fields: list = [],
+        load: list | dict = [],
+    ) -> None:
+        """
+        Построение запроса.
+
+        :param db: класс таблицы из которой необходимо получить данные
+        :param where: условия выборки, изменяемые значения - `bindparam('имя')`
+        :param order_by: параметры сортировки
+        :param group_by: параметры группировки
+        :param join_lst: список джойнов
+        :param aggregate: словарь с агрегатными функциями
+        :param fields: поля для выборки
+        :param load: связи, загружаемые вместе с экземплярами
+
+        :raise Exception: не верное описание джойнов или агрегатных функций
+        """
+
+        validate_join_lst(join_lst)
+        validate_aggregate(db, aggregate)
+
+        self.db = db
+        # Возвращать строки, а не экземпляры модели
+        self.rows = bool(fields)
+
+        query = build_select(
+            db, where, order_by, group_by, join_lst, aggregate, fields
+        )
+        if load:
+            query = query.options(*build_load_options(db, load))
+        self.query = query
+
+        # Именованные `bindparam`, в отличие от значений из условий вида
+        # `User.id == 1`, не уникализируются
+        binds = [
+            element
+            for element in visitors.iterate(query)
+            if isinstance(element, BindParameter) and not element.unique
+        ]
+        self.names = {bind.key for bind in binds}
+        # Параметры без значения, обязательные при выполнении
+        self.params = {bind.key for bind in binds if bind.required}
+        # Диалекты, которыми запрос уже скомпилирован
+        self.__dialects = set()
+
+    def check_dialect(self, dialect) -> None:
+        """
+        Проверка, что запрос компилируется диалектом, выполняемая один раз.
+
+        Скомпилированный запрос не сохраняется: при выполнении используется
+        кэш компиляции SQLAlchemy по ключу того же объекта запроса.
+
+        :param dialect: диалект БД
+
+        :raise Exception: запрос не компилируется диалектом
+        """
+
+        if dialect.name in self.__dialects:
+            return
+
+        self.query.compile(dialect=dialect)
+        self.__dialects.add(dialect.name)
+
+    def check_params(self, params: dict) -> None:
+        """
+        Проверка параметров выполнения.
+
+        :param params: значения параметров `bindparam`
+
+        :raise Exception: не переданы обязательные или переданы неизвестные
+            параметры
+        """
+
+        missing = self.params - set(params)
+        if missing:
+            msg = f'Не переданы параметры запроса `{sorted(missing)}`!'
+            raise Exception(msg)
+
+        unknown = set(params) - self.names
+        if unknown:
+            msg = f'Неизвестные параметры запроса `{sorted(unknown)}`!'
+            raise Exception(msg)
+
+    def __repr__(self) -> str:
+        return f'QuerySpec({self.db.__name__}, params={sorted(self.params)})'
@@ -5,8 +5,13 @@ from collections.abc import AsyncGenerator
 from unittest.mock import MagicMock
 
 import pytest
+from sqlalchemy import NullPool
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
 
+from sql_assistant.cache import MemoryCache
 from sql_assistant.main import SqlAssistant
+from sql_assistant.metrics import StatsRegistry
 from tests.test_api.factory import (
     make_user,
 )
@@ -90,3 +95,41 @@ async def sql_assistant() -> SqlAssistant:
     """Возвращает тестовый объект помощника."""
 
     return SqlAssistant(base=Base, async_session=async_session, log=mock_log)
+
+
+@pytest.fixture(name='sas_cache')
+async def sql_assistant_with_cache() -> SqlAssistant:
+    """Возвращает тестовый объект помощника с кэшем объектов."""
+
+    return SqlAssistant(
+        base=Base, async_session=async_session, log=mock_log, obj_cache=MemoryCache()
+    )
+
+
+@pytest.fixture(name='sas_metrics')
+async def sql_assistant_with_metrics() -> SqlAssistant:
+    """Возвращает тестовый объект помощника со сбором статистики."""
+
+    return SqlAssistant(
+        base=Base, async_session=async_session, log=mock_log, metrics=StatsRegistry()
+    )
+
+
+@pytest.fixture(name='sas_replica')
+async def sql_assistant_with_replica() -> AsyncGenerator:
+    """Возвращает тестовый объект помощника с репликой, подключённой к той же БД."""
+
+    replica_engine = create_async_engine(engine.url, poolclass=NullPool)
+    replica_session = sessionmaker(
+        replica_engine, class_=AsyncSession, expire_on_commit=False
+    )
+
+    yield SqlAssistant(
+        base=Base,
+        async_session=async_session,
+        log=mock_log,
+        replicas=[replica_session],
+        read_your_writes=60,
+    )
+
+    await replica_engine.dispose()
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, DateTime, func, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, func, Boolean, ForeignKey
+from sqlalchemy.orm import relationship
 
 from tests.test_api.test_db import Base
 
@@ -16,8 +17,23 @@ class User(Base):
     create_at = Column(DateTime(), nullable=False, default=func.now())
     is_delete = Column(Boolean(), nullable=False, default=False)
 
+    posts = relationship('Post', back_populates='user')
+
     @property
     def print(self):  # noqa: A003
         """Выводит данные пользователя."""
 
         return f'{self.id} {self.username}'
+
+
+class Post(Base):
+    """Таблица публикаций пользователей."""
+
+    # Название таблицы
+    __tablename__ = 'post'
+
+    id = Column(Integer(), autoincrement=True, primary_key=True)  # noqa: A003
+    user_id = Column(Integer(), ForeignKey('user.id'), nullable=False)
+    title = Column(String(100), nullable=False)
+
+    user = relationship('User', back_populates='posts')
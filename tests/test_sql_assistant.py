@@ -1,11 +1,35 @@
+import asyncio
+import contextvars
+import datetime
+import functools
+
 import pytest
+from sqlalchemy import bindparam, event, func, select
+from sqlalchemy.dialects.postgresql.asyncpg import PGDialect_asyncpg
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
+from sql_assistant.cache import MemoryCache
+from sql_assistant.handler import compile_positional
+from sql_assistant.ids import IdAllocator
+from sql_assistant.main import SqlAssistant
+from sql_assistant.metrics import StatsRegistry
+from sql_assistant.retry import RetryPolicy
+from sql_assistant.spec import QuerySpec
 from tests.conftest import id_func
 from tests.test_api.helper import read_test_data_from_yaml
-from tests.test_api.test_models import User
+from tests.test_api.test_db import Base, async_session, engine
+from tests.test_api.test_models import Post, User
 
 test_data = read_test_data_from_yaml('tests/scrub/sql_assistant.yaml')
 
+# Запросы, построенные при импорте модуля
+user_spec = QuerySpec(User, where=[User.id == bindparam('id')])
+name_spec = QuerySpec(
+    User, where=[User.id == bindparam('id')], fields=[User.name, User.username]
+)
+
 
 
 @pytest.mark.usefixtures('_clean_database')
@@ -70,3 +94,1127 @@ async def test_update_objs(data, create_users, sas):  # noqa: ARG001
             assert (
                     getattr(obj, key) == value
             ), f'`{key}` объекта не соответствует ожидаемому `{value}`'
+
+
+@pytest.mark.usefixtures('_clean_database')
+@pytest.mark.parametrize('data', test_data['test_create_objs'], ids=id_func)
+async def test_create_objs(data, create_users, sas):  # noqa: ARG001
+    """
+    Проверка массового создания объектов.
+
+    :param data: тестовые данные
+    :param client: тестовый клиент пользователя
+    """
+
+    rows = data.get('rows', [])
+    num = data['expected_result']['num']
+
+    result = await sas.create_objs(User, rows, batch_size=1, error=False)
+
+    assert result == num, f'Создано не верное количество объектов: `{result}`'
+
+    if not num:
+        # В ошибке большой пачки выводится только её начало и номера строк
+        filler = [
+            {'id': 1000 + idx, 'username': f'filler{idx}@q.q', 'password': 'pass'}
+            for idx in range(100)
+        ]
+        with pytest.raises(Exception, match='с 0 по 100') as exc_info:
+            await sas.create_objs(User, filler + rows)
+
+        assert (
+                'filler99' not in str(exc_info.value)
+        ), 'в сообщение об ошибке попала вся пачка'
+        return
+
+    ids = [row['id'] for row in rows]
+    objs = await sas.get_all_objs(User, [User.id.in_(ids)], [User.id], error=False)
+
+    assert [obj.id for obj in objs] == ids, 'созданные объекты не найдены'
+
+
+@pytest.mark.usefixtures('_clean_database')
+@pytest.mark.parametrize('data', test_data['test_upsert_objs'], ids=id_func)
+async def test_upsert_objs(data, create_users, sas):  # noqa: ARG001
+    """
+    Проверка создания или обновления объектов одним запросом.
+
+    :param data: тестовые данные
+    :param client: тестовый клиент пользователя
+    """
+
+    rows = data.get('rows', [])
+    expected_result = data.get('expected_result', {})
+
+    result = await sas.upsert_objs(User, rows, ['id'], error=False)
+
+    num = expected_result['num']
+    assert result == num, f'Затронуто не верное количество объектов: `{result}`'
+
+    ids = [row['id'] for row in rows]
+    objs = await sas.get_all_objs(User, [User.id.in_(ids)], [User.id], error=False)
+
+    for idx, obj in enumerate(objs):
+        for key, value in expected_result['new_users'][idx].items():
+            assert (
+                    getattr(obj, key) == value
+            ), f'`{key}` объекта не соответствует ожидаемому `{value}`'
+
+
+@pytest.mark.usefixtures('_clean_database')
+@pytest.mark.parametrize('data', test_data['test_iter_objs'], ids=id_func)
+async def test_iter_objs(data, create_users, sas):  # noqa: ARG001
+    """
+    Проверка потокового получения объектов.
+
+    :param data: тестовые данные
+    :param client: тестовый клиент пользователя
+    """
+
+    chunk_size = data['chunk_size']
+    expected_result = data.get('expected_result', {})
+
+    ids = [
+        obj.id
+        async for obj in sas.iter_objs(
+            User, order_by=[User.id], chunk_size=chunk_size
+        )
+    ]
+    assert ids == expected_result['ids'], f'Получены не верные объекты: `{ids}`'
+
+    partitions = [
+        len(partition)
+        async for partition in sas.iter_objs(
+            User, order_by=[User.id], chunk_size=chunk_size, partitions=True
+        )
+    ]
+    assert (
+            partitions == expected_result['partitions']
+    ), f'Получены не верные пачки: `{partitions}`'
+
+
+@pytest.mark.usefixtures('_clean_database')
+@pytest.mark.parametrize('data', test_data['test_paginate'], ids=id_func)
+async def test_paginate(data, create_users, sas):  # noqa: ARG001
+    """
+    Проверка keyset-пагинации.
+
+    :param data: тестовые данные
+    :param client: тестовый клиент пользователя
+    """
+
+    column = getattr(User, data.get('order', 'id'))
+    order_by = [column.desc()] if data.get('desc') else [column]
+    expected_pages = data['expected_result']['pages']
+
+    null_names = data.get('null_names', [])
+    if null_names:
+        await sas.update_objs(User, {'name': None}, [User.id.in_(null_names)])
+
+    pages = []
+    token = None
+    while True:
+        objs, token = await sas.paginate(
+            User, order_by=order_by, page_size=data['page_size'], after=token
+        )
+        pages.append([obj.id for obj in objs])
+
+        if token is None:
+            break
+
+    assert pages == expected_pages, f'Получены не верные страницы: `{pages}`'
+
+    # Значения курсора берутся из экземпляров, поэтому сортировка только по
+    # столбцам самой таблицы
+    assert (
+            await sas.paginate(User, order_by=[Post.id], error=False) is None
+    ), 'сортировка по столбцу другой таблицы не отклонена'
+
+
+@pytest.mark.usefixtures('_clean_database')
+@pytest.mark.parametrize('data', test_data['test_get_obj'], ids=id_func)
+async def test_query_cache(data, create_users, sas):  # noqa: ARG001
+    """
+    Проверка кэша построенных запросов выборки.
+
+    :param data: тестовые данные
+    :param client: тестовый клиент пользователя
+    """
+
+    user = data.get('user', {})
+    result = data.get('result')
+    where = [User.id == user.get('id')]
+
+    sas.query_cache.clear()
+    await sas.get_all_objs(User, where, shape='by_id')
+    objs = await sas.get_all_objs(User, where, shape='by_id')
+
+    assert len(objs) == (1 if result else 0), 'не верное количество объектов'
+    assert (
+            sas.query_cache.misses == 1 and sas.query_cache.hits == 1
+    ), f'не верные счётчики кэша: `{sas.query_cache.info()}`'
+
+    # Запрос без названия формы строится заново и не попадает в кэш
+    rows = await sas.get_all_objs(User, where, fields=[User.name])
+
+    assert len(sas.query_cache) == 1, 'в кэш попал запрос без названия формы'
+    assert (
+            [row[0] for row in rows] == ([result['name']] if result else [])
+    ), f'не верный результат без кэша: `{rows}`'
+
+    # Джойн с псевдонимом таблицы
+    await sas.create_objs(Post, [{'user_id': 101, 'title': 'post'}])
+    post = aliased(Post)
+    join_lst = [{'target': post, 'onclause': post.user_id == User.id}]
+
+    for _ in range(2):
+        objs = await sas.get_all_objs(
+            User, where, join_lst=join_lst, shape='by_id_with_post'
+        )
+        count = await sas.count_objs(User, where, join_lst=join_lst)
+        is_exists = await sas.exists_obj(User, where, join_lst=join_lst)
+
+        assert len(objs) == count == (1 if result else 0), 'не верный джойн'
+        assert is_exists is bool(result), 'не верная проверка наличия с джойном'
+
+
+@pytest.mark.usefixtures('_clean_database')
+@pytest.mark.parametrize('data', test_data['test_update_objs'], ids=id_func)
+async def test_get_obj_cache(data, create_users, sas_cache):  # noqa: ARG001
+    """
+    Проверка кэша объектов и его сброса при обновлении.
+
+    :param data: тестовые данные
+    :param client: тестовый клиент пользователя
+    """
+
+    user = data.get('user', {})
+    update_data = data.get('data', {})
+    expected_result = data.get('expected_result', {})
+
+    obj = await sas_cache.get_obj(User, user['id'])
+    cached_obj = await sas_cache.get_obj(User, user['id'])
+    assert obj is cached_obj, 'объект не был взят из кэша'
+
+    await sas_cache.update_objs(User, update_data, [User.id == user['id']])
+
+    obj = await sas_cache.get_obj(User, user['id'])
+    for key, value in expected_result['new_users'][0].items():
+        assert (
+                getattr(obj, key) == value
+        ), f'`{key}` объекта не соответствует ожидаемому `{value}`'
+
+    # Внутри транзакции кэш сбрасывается только после коммита: другой запрос
+    # до коммита снова кэширует ещё не изменённую строку
+    async with sas_cache.transaction():
+        await sas_cache.update_objs(
+            User, {'name': 'in_transaction'}, [User.id == user['id']]
+        )
+        await asyncio.create_task(
+            sas_cache.get_obj(User, user['id']), context=contextvars.Context()
+        )
+
+    obj = await sas_cache.get_obj(User, user['id'])
+
+    assert obj.name == 'in_transaction', 'из кэша получен объект до коммита'
+
+
+@pytest.mark.usefixtures('_clean_database')
+@pytest.mark.parametrize('data', test_data['test_get_objs_by_ids'], ids=id_func)
+async def test_get_objs_by_ids(data, create_users, sas):  # noqa: ARG001
+    """
+    Проверка получения объектов по списку id.
+
+    :param data: тестовые данные
+    :param client: тестовый клиент пользователя
+    """
+
+    objs = await sas.get_objs_by_ids(
+        User, data['ids'], chunk_size=data.get('chunk_size', 500)
+    )
+
+    ids = [obj.id for obj in objs]
+    expected_ids = data['expected_result']['ids']
+    assert ids == expected_ids, f'Получены не верные объекты: `{ids}`'
+
+
+@pytest.mark.usefixtures('_clean_database')
+@pytest.mark.parametrize('data', test_data['test_bulk_update_objs'], ids=id_func)
+async def test_bulk_update_objs(data, create_users, sas):  # noqa: ARG001
+    """
+    Проверка обновления объектов разными данными.
+
+    :param data: тестовые данные
+    :param client: тестовый клиент пользователя
+    """
+
+    rows = data.get('rows', [])
+    expected_result = data.get('expected_result', {})
+
+    result = await sas.bulk_update_objs(User, rows, batch_size=2, error=False)
+
+    num = expected_result['num']
+    assert (
+            result == num
+    ), f'Обновлено не верное количество объектов: `{result} != {num}`'
+
+    ids = [user['id'] for user in expected_result['new_users']]
+    objs = await sas.get_all_objs(User, [User.id.in_(ids)], [User.id], error=False)
+
+    for idx, obj in enumerate(objs):
+        for key, value in expected_result['new_users'][idx].items():
+            assert (
+                    getattr(obj, key) == value
+            ), f'`{key}` объекта не соответствует ожидаемому `{value}`'
+
+
+@pytest.mark.usefixtures('_clean_database')
+@pytest.mark.parametrize('data', test_data['test_bulk_update_objs'], ids=id_func)
+async def test_bulk_update_objs_cache(data, create_users, sas_cache):  # noqa: ARG001
+    """
+    Проверка сброса кэша после зафиксированных пачек при ошибке следующей.
+
+    :param data: тестовые данные
+    :param client: тестовый клиент пользователя
+    """
+
+    rows = data.get('rows', [])[:2]
+    user_id = rows[0]['id']
+
+    await sas_cache.get_obj(User, user_id)
+
+    # Вторая пачка нарушает уникальность `username`
+    failed_row = {'id': 201, 'username': 'user1@q.q'}
+    with pytest.raises(IntegrityError):
+        await sas_cache.bulk_update_objs(User, [*rows, failed_row], batch_size=2)
+
+    obj = await sas_cache.get_obj(User, user_id)
+
+    assert (
+            obj.name == rows[0]['name']
+    ), 'из кэша получен объект до зафиксированной пачки'
+
+
+@pytest.mark.usefixtures('_clean_database')
+@pytest.mark.parametrize('data', test_data['test_update_objs'], ids=id_func)
+async def test_transaction(data, create_users, sas):  # noqa: ARG001
+    """
+    Проверка общей транзакции для нескольких вызовов.
+
+    :param data: тестовые данные
+    :param client: тестовый клиент пользователя
+    """
+
+    user = data.get('user', {})
+    update_data = data.get('data', {})
+    expected_result = data.get('expected_result', {})
+
+    old_obj = await sas.get_obj(User, user['id'])
+
+    # Ошибка внутри блока откатывает все изменения
+    with pytest.raises(ValueError, match='rollback'):
+        async with sas.transaction():
+            await sas.update_objs(User, update_data, [User.id == user['id']])
+            raise ValueError('rollback')
+
+    obj = await sas.get_obj(User, user['id'])
+    for key in update_data:
+        assert getattr(obj, key) == getattr(
+            old_obj, key
+        ), f'`{key}` объекта изменился после отката'
+
+    # Ошибка вызова с `error=False` откатывает только его точку сохранения
+    async with sas.transaction():
+        await sas.update_objs(User, update_data, [User.id == user['id']])
+        await sas.create_obj(User, {'username': old_obj.username}, error=False)
+
+    obj = await sas.get_obj(User, user['id'])
+    for key, value in expected_result['new_users'][0].items():
+        assert (
+                getattr(obj, key) == value
+        ), f'`{key}` объекта не соответствует ожидаемому `{value}`'
+
+
+@pytest.mark.usefixtures('_clean_database')
+@pytest.mark.parametrize('data', test_data['test_get_obj'], ids=id_func)
+async def test_metrics(data, create_users, sas_metrics):  # noqa: ARG001
+    """
+    Проверка сбора статистики вызовов.
+
+    :param data: тестовые данные
+    :param client: тестовый клиент пользователя
+    """
+
+    user = data.get('user', {})
+    result = data.get('result')
+
+    await sas_metrics.get_obj(User, user.get('id'), error=False)
+    objs = await sas_metrics.get_all_objs(User)
+
+    stats = sas_metrics.metrics.snapshot()
+
+    assert stats['get_obj']['count'] == 1, 'вызов `get_obj` не записан'
+    errors = 0 if result else 1
+    assert stats['get_obj']['errors'] == errors, 'не верно число ошибок'
+    assert stats['get_all_objs']['rows'] == len(objs), 'не верно число строк'
+    assert stats['session']['count'] == 2, 'открытие сессий не записано'
+
+
+@pytest.mark.usefixtures('_clean_database')
+@pytest.mark.parametrize('data', test_data['test_get_obj'], ids=id_func)
+async def test_get_all_objs_readonly(data, create_users, sas):  # noqa: ARG001
+    """
+    Проверка получения строк без создания объектов ORM.
+
+    :param data: тестовые данные
+    :param client: тестовый клиент пользователя
+    """
+
+    user = data.get('user', {})
+    result = data.get('result')
+
+    rows = await sas.get_all_objs(User, [User.id == user.get('id')], readonly=True)
+
+    if not result:
+        assert rows == [], 'найдена строка, которую не ждали'
+
+        return
+
+    assert len(rows) == 1, 'строка не была найдена'
+    assert not isinstance(rows[0], User), 'вернулся объект ORM'
+
+    row = rows[0]._asdict()
+    for key, value in result.items():
+        assert (
+                row[key] == value
+        ), f'`{key}` строки не соответствует ожидаемому `{value}`'
+
+
+@pytest.mark.usefixtures('_clean_database')
+@pytest.mark.parametrize('data', test_data['test_get_all_objs_load'], ids=id_func)
+async def test_get_all_objs_load(data, create_users, sas):  # noqa: ARG001
+    """
+    Проверка загрузки связей без N+1 запросов.
+
+    :param data: тестовые данные
+    :param client: тестовый клиент пользователя
+    """
+
+    users = await sas.get_all_objs(User, order_by=[User.id])
+    posts = [
+        {'user_id': user.id, 'title': f'post{idx}'}
+        for idx, user in enumerate(users)
+        for _ in range(idx + 1)
+    ]
+    await sas.create_objs(Post, posts)
+
+    statements = []
+
+    def listener(conn, cursor, statement, *args) -> None:  # noqa: ARG001
+        """Запись выполненных запросов выборки."""
+
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append(statement)
+
+    event.listen(engine.sync_engine, 'before_cursor_execute', listener)
+
+    try:
+        # Количество запросов не должно зависеть от количества строк
+        for count in (1, len(users)):
+            statements.clear()
+            objs = await sas.get_all_objs(
+                User, [User.id.in_([user.id for user in users[:count]])],
+                load=data['load'],
+            )
+            num_posts = sum(len(obj.posts) for obj in objs)
+
+            assert num_posts == sum(range(1, count + 1)), 'связи загружены не все'
+            assert (
+                    len(statements) == data['expected_result']['statements']
+            ), f'Выполнено не верное количество запросов: `{len(statements)}`'
+    finally:
+        event.remove(engine.sync_engine, 'before_cursor_execute', listener)
+
+
+@pytest.mark.usefixtures('_clean_database')
+@pytest.mark.parametrize('data', test_data['test_get_obj'], ids=id_func)
+async def test_session_scope(data, create_users, sas):  # noqa: ARG001
+    """
+    Проверка общей сессии для нескольких вызовов.
+
+    :param data: тестовые данные
+    :param client: тестовый клиент пользователя
+    """
+
+    user = data.get('user', {})
+    result = data.get('result')
+
+    async with sas.session_scope() as session:
+        obj = await sas.get_obj(User, user.get('id'), error=False)
+        objs = await sas.get_all_objs(User)
+
+        async with sas.session_scope() as inner_session:
+            assert inner_session is session, 'вложенный блок открыл новую сессию'
+
+    if result:
+        # Объект из карты объектов общей сессии
+        assert any(item is obj for item in objs), 'вызовы использовали разные сессии'
+    else:
+        assert obj is None, 'найден несуществующий объект'
+
+    stats = sas.pool_stats()
+
+    assert stats['pool'] == type(engine.pool).__name__, 'не верный класс пула'
+
+
+@pytest.mark.usefixtures('_clean_database')
+@pytest.mark.parametrize('data', test_data['test_get_obj'], ids=id_func)
+async def test_from_url(data, create_users, sas):  # noqa: ARG001
+    """
+    Проверка помощника с собственным движком и пулом подключений.
+
+    :param data: тестовые данные
+    :param client: тестовый клиент пользователя
+    """
+
+    user = data.get('user', {})
+    result = data.get('result')
+
+    own = SqlAssistant.from_url(
+        engine.url,
+        Base,
+        sas.log,
+        pool_size=2,
+        max_overflow=1,
+        statement_cache_size=0,
+        engine_kwargs={
+            'poolclass': AsyncAdaptedQueuePool,
+            'connect_args': {'timeout': 5},
+        },
+    )
+
+    connect_params = []
+    event.listen(
+        own.engine.sync_engine,
+        'do_connect',
+        lambda dialect, conn_rec, cargs, cparams: connect_params.append(cparams),
+    )
+
+    obj = await own.get_obj(User, user.get('id'), error=False)
+    stats = own.pool_stats()
+
+    assert (obj is not None) is bool(result), 'не верный результат запроса'
+    assert (
+            stats['pool'] == 'AsyncAdaptedQueuePool' and stats['size'] == 2
+    ), f'не верные параметры пула: `{stats}`'
+    assert stats['checkedin'] == 1, f'соединение не вернулось в пул: `{stats}`'
+
+    # Параметры подключения из `engine_kwargs` объединяются с кэшем asyncpg
+    assert connect_params[0]['timeout'] == 5, 'потеряны параметры подключения'
+    if own.engine.dialect.driver == 'asyncpg':
+        assert (
+                connect_params[0]['statement_cache_size'] == 0
+        ), 'не передан размер кэша подготовленных запросов'
+
+    await own.dispose()
+
+    assert own.pool_stats()['checkedin'] == 0, 'соединения не закрыты'
+
+
+@pytest.mark.usefixtures('_clean_database')
+@pytest.mark.parametrize('data', test_data['test_get_obj'], ids=id_func)
+async def test_gather_queries(data, create_users, sas):  # noqa: ARG001
+    """
+    Проверка параллельного выполнения запросов.
+
+    :param data: тестовые данные
+    :param client: тестовый клиент пользователя
+    """
+
+    user = data.get('user', {})
+    result = data.get('result')
+
+    queries = [
+        functools.partial(sas.get_obj, User, user.get('id')),
+        functools.partial(sas.get_all_objs, User, order_by=[User.id]),
+    ]
+    obj, objs = await sas.gather_queries(queries, max_concurrency=1, error=False)
+
+    assert objs, 'результат второго запроса не получен'
+    if result:
+        for key, value in result.items():
+            assert (
+                    getattr(obj, key) == value
+            ), f'`{key}` объекта не соответствует ожидаемому `{value}`'
+    else:
+        assert obj is None, 'ошибка запроса не заменена на None'
+
+        with pytest.raises(Exception):  # noqa: B017, PT011
+            await sas.gather_queries(queries)
+
+
+@pytest.mark.usefixtures('_clean_database')
+@pytest.mark.parametrize('data', test_data['test_get_obj'], ids=id_func)
+async def test_aggregate_objs(data, create_users, sas):  # noqa: ARG001
+    """
+    Проверка подсчёта строк и агрегатов без выборки строк.
+
+    :param data: тестовые данные
+    :param client: тестовый клиент пользователя
+    """
+
+    user = data.get('user', {})
+    result = data.get('result')
+    where = [User.id == user.get('id')]
+
+    count = await sas.count_objs(User, where)
+    is_exists = await sas.exists_obj(User, where)
+
+    assert count == (1 if result else 0), f'не верное количество строк: `{count}`'
+    assert is_exists is bool(result), 'не верный результат проверки наличия'
+
+    objs = await sas.get_all_objs(User)
+    stats = await sas.aggregate_objs(
+        User, metrics={'total': func.count(), 'max_id': func.max(User.id)}
+    )
+
+    assert stats.total == len(objs), 'не верное количество строк в агрегате'
+    assert stats.max_id == max(obj.id for obj in objs), 'не верный максимум'
+
+    groups = await sas.aggregate_objs(
+        User, group_by=[User.is_delete], metrics={'total': func.count()}
+    )
+
+    assert (
+            sum(group.total for group in groups) == len(objs)
+    ), 'сумма по группам не совпадает с количеством строк'
+
+
+@pytest.mark.usefixtures('_clean_database')
+@pytest.mark.parametrize('data', test_data['test_create_objs'], ids=id_func)
+async def test_create_obj_returning(data, create_users, sas):  # noqa: ARG001
+    """
+    Проверка создания объекта через `INSERT ... RETURNING`.
+
+    :param data: тестовые данные
+    :param client: тестовый клиент пользователя
+    """
+
+    row = data.get('rows', [])[0]
+    num = data['expected_result']['num']
+
+    obj = await sas.create_obj(User, row, returning=True, error=False)
+
+    if not num:
+        assert obj is None, 'создан объект с существующими данными'
+        return
+
+    for key, value in row.items():
+        assert (
+                getattr(obj, key) == value
+        ), f'`{key}` объекта не соответствует ожидаемому `{value}`'
+    assert obj.create_at is not None, 'значение по умолчанию БД не получено'
+
+    obj = await sas.create_or_update(
+        User, {'name': 'updated'}, [User.id == row['id']], returning=True
+    )
+
+    assert obj.name == 'updated', 'объект не обновлён'
+
+
+@pytest.mark.usefixtures('_clean_database')
+@pytest.mark.parametrize('data', test_data['test_create_objs'], ids=id_func)
+async def test_reserve_ids(data, create_users, sas):  # noqa: ARG001
+    """
+    Проверка создания связанных объектов с зарезервированными id.
+
+    :param data: тестовые данные
+    :param client: тестовый клиент пользователя
+    """
+
+    if engine.dialect.name != 'postgresql':
+        pytest.skip('последовательности есть только в PostgreSQL')
+
+    if not data['expected_result']['num']:
+        return
+
+    rows = [
+        {key: value for key, value in row.items() if key != 'id'}
+        for row in data.get('rows', [])
+    ]
+
+    allocator = IdAllocator(sas, block_size=1)
+    ids = await allocator.take(User, len(rows))
+
+    assert len(set(ids)) == len(rows), 'зарезервированы повторяющиеся id'
+
+    users = [{'id': id_, **row} for id_, row in zip(ids, rows, strict=True)]
+    posts = [{'user_id': id_, 'title': f'post{id_}'} for id_ in ids]
+    await sas.create_objs(User, users)
+    await sas.create_objs(Post, posts)
+
+    count = await sas.count_objs(Post, [Post.user_id.in_(ids)])
+
+    assert count == len(posts), 'связанные объекты не созданы'
+
+
+@pytest.mark.usefixtures('_clean_database')
+@pytest.mark.parametrize('data', test_data['test_create_objs'], ids=id_func)
+async def test_write_buffer(data, create_users, sas):  # noqa: ARG001
+    """
+    Проверка записи строк через буфер.
+
+    :param data: тестовые данные
+    :param client: тестовый клиент пользователя
+    """
+
+    rows = data.get('rows', [])
+    num = data['expected_result']['num']
+
+    buffer = sas.write_buffer(max_size=len(rows), flush_interval=60)
+    futures = [await buffer.create(User, row) for row in rows]
+
+    results = await asyncio.gather(*futures, return_exceptions=True)
+    errors = [result for result in results if isinstance(result, Exception)]
+
+    assert bool(errors) is not bool(num), f'не верный результат записи: `{results}`'
+
+    if not num:
+        return
+
+    ids = [row['id'] for row in rows]
+    update = await buffer.update(User, {'id': ids[0], 'name': 'updated'})
+    await sas.close()
+
+    assert update.done(), 'буфер не записан при закрытии'
+
+    obj = await sas.get_obj(User, ids[0])
+
+    assert obj.name == 'updated', 'объект не обновлён'
+
+    # Строки, ждавшие места в буфере во время закрытия, не теряются молча
+    buffer = sas.write_buffer(flush_interval=60, max_pending=1)
+    first = await buffer.update(User, {'id': ids[0], 'name': 'first'})
+    waiting = [
+        asyncio.create_task(buffer.update(User, {'id': id_, 'name': 'late'}))
+        for id_ in ids
+    ]
+    await asyncio.sleep(0)
+    await buffer.close()
+    results = await asyncio.gather(*waiting, return_exceptions=True)
+
+    assert first.done(), 'строка не записана при закрытии'
+    assert (
+            len(buffer) == 0
+    ), f'в закрытом буфере остались строки: `{len(buffer)}`'
+    for result in results:
+        assert (
+                isinstance(result, Exception) or result.done()
+        ), 'строка, добавленная при закрытии, не записана и не отклонена'
+
+
+@pytest.mark.usefixtures('_clean_database')
+@pytest.mark.parametrize('data', test_data['test_update_objs'], ids=id_func)
+async def test_replicas(data, create_users, sas_replica):  # noqa: ARG001
+    """
+    Проверка чтения с реплики и с основной БД после записи.
+
+    :param data: тестовые данные
+    :param client: тестовый клиент пользователя
+    """
+
+    user = data.get('user', {})
+    update_data = data.get('data', {})
+    replica_engine = sas_replica.replicas[0].kw['bind']
+
+    statements = []
+
+    def listener(conn, cursor, statement, *args) -> None:  # noqa: ARG001
+        """Запись запросов, выполненных на реплике."""
+
+        statements.append(statement)
+
+    event.listen(replica_engine.sync_engine, 'before_cursor_execute', listener)
+
+    try:
+        await sas_replica.get_all_objs(User)
+
+        assert statements, 'чтение выполнено не на реплике'
+
+        await sas_replica.update_objs(User, update_data, [User.id == user['id']])
+        statements.clear()
+        await sas_replica.get_obj(User, user['id'], error=False)
+
+        assert not statements, 'чтение после записи выполнено на реплике'
+    finally:
+        event.remove(replica_engine.sync_engine, 'before_cursor_execute', listener)
+
+
+@pytest.mark.usefixtures('_clean_database')
+@pytest.mark.parametrize('data', test_data['test_update_objs'], ids=id_func)
+async def test_replicas_read_your_writes(
+    data, create_users, sas_replica  # noqa: ARG001
+):
+    """
+    Проверка чтения после записи с объединением запросов и кэшем объектов.
+
+    :param data: тестовые данные
+    :param client: тестовый клиент пользователя
+    """
+
+    user = data.get('user', {})
+    update_data = data.get('data', {})
+    sas = SqlAssistant(
+        base=sas_replica.base,
+        async_session=sas_replica.async_session,
+        log=sas_replica.log,
+        replicas=sas_replica.replicas,
+        read_your_writes=60,
+        coalesce=True,
+        obj_cache=MemoryCache(),
+    )
+    replica_engine = sas.replicas[0].kw['bind']
+    other_id = next(id_ for id_ in (101, 102) if id_ != user['id'])
+
+    params = []
+
+    def listener(conn, cursor, statement, parameters, *args) -> None:  # noqa: ARG001
+        """Запись параметров запросов, выполненных на реплике."""
+
+        params.append(str(parameters))
+
+    def read_elsewhere(id_):
+        """Чтение из контекста без записи, как из другого запроса."""
+
+        return asyncio.create_task(
+            sas.get_obj(User, id_), context=contextvars.Context()
+        )
+
+    await sas.update_objs(User, update_data, [User.id == user['id']])
+    event.listen(replica_engine.sync_engine, 'before_cursor_execute', listener)
+
+    try:
+        # Объединённый запрос начат контекстом без записи
+        reader = read_elsewhere(other_id)
+        await asyncio.sleep(0)
+        obj = await sas.get_obj(User, user['id'])
+        await reader
+
+        assert (
+                not any(str(user['id']) in param for param in params)
+        ), f'объект после записи прочитан с реплики: `{params}`'
+
+        # Объект с реплики после записи в таблицу не попадает в кэш
+        await sas.obj_cache.delete((User, user['id']))
+        await read_elsewhere(user['id'])
+
+        assert (
+                await sas.obj_cache.get((User, user['id'])) is None
+        ), 'в кэш сохранён объект с реплики после записи'
+
+        obj = await sas.get_obj(User, user['id'])
+
+        for key, value in update_data.items():
+            assert getattr(obj, key) == value, f'не верное значение `{key}`'
+    finally:
+        event.remove(replica_engine.sync_engine, 'before_cursor_execute', listener)
+
+
+@pytest.mark.usefixtures('_clean_database')
+@pytest.mark.parametrize('data', test_data['test_export_objs'], ids=id_func)
+async def test_export_objs(data, create_users, sas, tmp_path):  # noqa: ARG001
+    """
+    Проверка потоковой выгрузки строк в файл.
+
+    :param data: тестовые данные
+    :param client: тестовый клиент пользователя
+    """
+
+    path = tmp_path / f'users.{data["fmt"]}'
+    objs = await sas.get_all_objs(User)
+
+    null_names = data.get('null_names', [])
+    if null_names:
+        await sas.update_objs(User, {'name': None}, [User.id.in_(null_names)])
+
+    stats = await sas.export_objs(
+        User,
+        fields=[User.id, User.username, User.name],
+        fmt=data['fmt'],
+        sink=path,
+        order_by=[User.id],
+        chunk_size=1,
+    )
+
+    assert stats['rows'] == len(objs), 'выгружено не верное количество строк'
+
+    if data['fmt'] == 'parquet':
+        parquet = pytest.importorskip('pyarrow.parquet')
+        names = parquet.read_table(path).column('name').to_pylist()
+
+        assert (
+                names == data['expected_result']['names']
+        ), f'не верные значения в файле: `{names}`'
+        return
+
+    lines = path.read_text(encoding='utf-8').splitlines()
+
+    assert (
+            lines[0] == data['expected_result']['header']
+    ), f'не верная первая строка файла: `{lines[0]}`'
+
+
+@pytest.mark.parametrize('data', test_data['test_get_objs_by_ids'], ids=id_func)
+async def test_compile_positional(data):
+    """
+    Проверка SQL и параметров запроса `COPY` выгрузки.
+
+    :param data: тестовые данные
+    """
+
+    ids = data['ids']
+    query = select(User.id, User.name).where(User.id.in_(ids), User.name == 'x')
+
+    sql, params = compile_positional(query, PGDialect_asyncpg())
+
+    assert 'POSTCOMPILE' not in sql, f'в SQL остались заглушки: `{sql}`'
+    assert (
+            sorted(params, key=str) == sorted([*ids, 'x'], key=str)
+    ), f'не верные параметры: `{params}`'
+    # Номер `$n` каждого параметра соответствует его позиции в списке
+    for idx, value in enumerate(params, 1):
+        placeholder = f'${idx}::VARCHAR' if value == 'x' else f'${idx}::INTEGER'
+        assert placeholder in sql, f'параметр `{value}` не на позиции {idx}: `{sql}`'
+
+
+@pytest.mark.usefixtures('_clean_database')
+@pytest.mark.parametrize('data', test_data['test_create_objs'], ids=id_func)
+async def test_load_objs(data, create_users, sas, tmp_path):  # noqa: ARG001
+    """
+    Проверка массовой загрузки строк из списка и файла.
+
+    :param data: тестовые данные
+    :param client: тестовый клиент пользователя
+    """
+
+    rows = data.get('rows', [])
+    num = data['expected_result']['num']
+
+    stats = await sas.load_objs(User, rows, chunk_size=1, error=False)
+
+    if not num:
+        assert stats is None, 'загружены строки с существующими данными'
+        return
+
+    assert stats['rows'] == num, f'Загружено не верное количество строк: `{stats}`'
+
+    # Повторная загрузка выгруженных строк из файла с обновлением по ключу
+    path = tmp_path / 'users.csv'
+    ids = [row['id'] for row in rows]
+    await sas.export_objs(User, [User.id.in_(ids)], fmt='csv', sink=path)
+    await sas.update_objs(User, {'name': 'updated'}, [User.id.in_(ids)])
+
+    stats = await sas.load_objs(User, path, conflict_keys=['id'])
+    objs = await sas.get_all_objs(User, [User.id.in_(ids)], [User.id])
+
+    assert stats['rows'] == num, f'Обновлено не верное количество строк: `{stats}`'
+    assert (
+            [obj.name for obj in objs] == [row['name'] for row in rows]
+    ), 'данные из файла не загружены'
+
+
+@pytest.mark.usefixtures('_clean_database')
+@pytest.mark.parametrize('data', test_data['test_create_objs'], ids=id_func)
+async def test_load_objs_rollback(data, create_users, sas):  # noqa: ARG001
+    """
+    Проверка отката всех пачек `COPY` при ошибке в одной из них.
+
+    :param data: тестовые данные
+    :param client: тестовый клиент пользователя
+    """
+
+    if engine.dialect.driver != 'asyncpg':
+        pytest.skip('загрузка одной транзакцией есть только в asyncpg')
+
+    # Все поля со значениями по умолчанию заданы: строки идут в таблицу напрямую
+    rows = [
+        {
+            **row,
+            'name': None,
+            'create_at': datetime.datetime(2024, 1, 1),
+            'is_delete': False,
+        }
+        for row in data.get('rows', [])
+    ]
+    # Последняя пачка нарушает уникальность `username`
+    failed_row = {**rows[0], 'id': 399, 'username': 'user1@q.q'}
+
+    stats = await sas.load_objs(User, [*rows, failed_row], chunk_size=1, error=False)
+    ids = [row['id'] for row in rows]
+    objs = await sas.get_all_objs(User, [User.id.in_(ids)], error=False)
+
+    assert stats is None, 'загрузка с ошибкой не вернула None'
+    assert objs == [], 'пачки до ошибки были зафиксированы'
+
+
+@pytest.mark.usefixtures('_clean_database')
+@pytest.mark.parametrize('data', test_data['test_get_obj'], ids=id_func)
+async def test_execute_spec(data, create_users, sas):  # noqa: ARG001
+    """
+    Проверка выполнения заранее построенного запроса.
+
+    :param data: тестовые данные
+    :param client: тестовый клиент пользователя
+    """
+
+    user = data.get('user', {})
+    result = data.get('result')
+
+    objs = await sas.execute_spec(user_spec, {'id': user.get('id')})
+    rows = await sas.execute_spec(name_spec, {'id': user.get('id')})
+
+    if not result:
+        assert objs == [], 'найден объект, которого не ждали'
+        assert rows == [], 'найдена строка, которую не ждали'
+        return
+
+    assert len(objs) == 1, 'объект не был найден'
+    for key, value in result.items():
+        assert (
+                getattr(objs[0], key) == value
+        ), f'не верное значение `{key}`: `{getattr(objs[0], key)}`'
+
+    expected = {'name': result['name'], 'username': result['username']}
+    assert rows[0]._asdict() == expected, f'не верная строка: `{rows[0]}`'
+
+    # Параметры и описание запроса проверяются до обращения к БД
+    assert (
+            await sas.execute_spec(user_spec, {}, error=False) is None
+    ), 'запрос выполнен без обязательного параметра'
+    assert (
+            await sas.execute_spec(user_spec, {'id': 1, 'name': 'x'}, error=False)
+            is None
+    ), 'запрос выполнен с неизвестным параметром'
+
+    with pytest.raises(Exception, match='тип джойна'):
+        QuerySpec(User, join_lst=[{'target': Post, 'type': 'cross'}])
+    with pytest.raises(Exception, match='нет в таблице'):
+        QuerySpec(User, aggregate={'unknown': func.count})
+
+
+@pytest.mark.usefixtures('_clean_database')
+@pytest.mark.parametrize('data', test_data['test_retry'], ids=id_func)
+async def test_retry(data, create_users, sas_metrics):  # noqa: ARG001
+    """
+    Проверка повтора методов при временных ошибках БД.
+
+    :param data: тестовые данные
+    :param client: тестовый клиент пользователя
+    """
+
+    class DriverError(Exception):
+        """Ошибка драйвера с кодом SQLSTATE."""
+
+        sqlstate = data['sqlstate']
+
+    sas_metrics.retry = RetryPolicy(attempts=3, base_delay=0)
+    name = 'update_objs' if data['write'] else 'get_all_objs'
+    prefix = 'UPDATE' if data['write'] else 'SELECT'
+    failures = [data['failures']]
+
+    def listener(conn, cursor, statement, *args) -> None:  # noqa: ARG001
+        """Ошибка на первых запросах метода."""
+
+        if failures[0] and statement.lstrip().upper().startswith(prefix):
+            failures[0] -= 1
+            raise DriverError(data['sqlstate'])
+
+    async def call(**kwargs):
+        """Вызов проверяемого метода."""
+
+        if data['write']:
+            return await sas_metrics.update_objs(
+                User, {'name': 'retried'}, [User.id == 101], error=False, **kwargs
+            )
+        return await sas_metrics.get_all_objs(
+            User, [User.id == 101], error=False, **kwargs
+        )
+
+    event.listen(engine.sync_engine, 'before_cursor_execute', listener)
+
+    try:
+        result = await call()
+        stats = sas_metrics.metrics.snapshot()[name]
+
+        assert (
+                stats['retries'] == data['expected_result']['retries']
+        ), f'не верное количество повторов: `{stats["retries"]}`'
+        assert (
+                (result is not None) is data['expected_result']['success']
+        ), f'не верный результат: `{result}`'
+
+        # Внутри `session_scope()` ошибка возвращается без повтора
+        failures[0] = 1
+        async with sas_metrics.session_scope():
+            result = await call()
+
+        assert result is None, 'метод внутри `session_scope()` повторён'
+        assert (
+                sas_metrics.metrics.snapshot()[name]['retries'] == stats['retries']
+        ), 'записан повтор внутри `session_scope()`'
+    finally:
+        event.remove(engine.sync_engine, 'before_cursor_execute', listener)
+
+
+@pytest.mark.usefixtures('_clean_database')
+@pytest.mark.parametrize('data', test_data['test_get_obj'], ids=id_func)
+async def test_slow_queries(data, create_users, sas):  # noqa: ARG001
+    """
+    Проверка вывода медленных запросов помощниками одного движка.
+
+    :param data: тестовые данные
+    :param client: тестовый клиент пользователя
+    """
+
+    user = data.get('user', {})
+    dispatch = engine.sync_engine.dispatch
+    listeners = len(dispatch.before_cursor_execute)
+
+    assistants = [
+        SqlAssistant(
+            base=Base,
+            async_session=async_session,
+            log=sas.log,
+            metrics=StatsRegistry(),
+            slow_query_threshold=0,
+        )
+        for _ in range(3)
+    ]
+
+    assert (
+            len(dispatch.before_cursor_execute) <= listeners + 1
+    ), 'обработчики событий добавлены для каждого помощника'
+
+    await assistants[0].get_obj(User, user.get('id'), error=False)
+    # Ошибка запроса не оставляет данных о его начале в соединении
+    await assistants[0].get_all_objs(User, [func.no_such_function()], error=False)
+
+    counts = [
+        assistant.metrics.snapshot().get('slow_query', {}).get('count', 0)
+        for assistant in assistants
+    ]
+
+    # Запрос учитывается только помощником, который его выполнил
+    assert (
+            counts[0] and counts[1:] == [0, 0]
+    ), f'не верное число записей: `{counts}`'
+
+    await assistants[0].close()
+    await assistants[1].get_obj(User, user.get('id'), error=False)
+
+    assert (
+            assistants[0].metrics.snapshot()['slow_query']['count'] == counts[0]
+    ), 'закрытый помощник получает события движка'
+    assert (
+            assistants[1].metrics.snapshot()['slow_query']['count'] > counts[1]
+    ), 'медленный запрос не записан'